@@ -0,0 +1,230 @@
+"""Admission control for tool calls and resource reads: per-client rate limits and a bounded queue.
+
+Every tool call has a cost, 1 unless configured otherwise, so that calls
+doing more work (listings, batches) can count for more. A call runs only if:
+- The client's token bucket holds enough tokens for the cost. Buckets refill
+  at `rate` tokens per second up to `burst`, so a client that floods the
+  server is throttled without slowing anyone else down.
+- One of `max_in_flight` slots for running calls is free. Calls beyond that
+  wait in a FIFO queue of at most `max_queue` calls, for at most
+  `queue_timeout` seconds.
+
+Calls that fail either check are rejected right away with a hint of when to
+retry, instead of piling up. Under overload, admitted calls keep a bounded
+latency and the excess fails fast.
+"""
+import asyncio
+import collections
+import functools
+import math
+import re
+import time
+
+# Rejections are returned to clients as tool results in this format (and
+# make up the error message of a rejected resource read)
+REJECTION_MESSAGE = "Error: Too many requests ({reason}); retry after {retry_after:.3f} seconds"
+_RETRY_AFTER = re.compile(r"Error: Too many requests \((\w+)\); retry after ([0-9.]+) seconds")
+
+# Idle clients whose buckets have refilled are forgotten beyond this many
+MAX_TRACKED_CLIENTS = 10_000
+
+
+class Rejected(Exception):
+    """A call was not admitted; `retry_after` is a hint in seconds."""
+
+    def __init__(self, reason, retry_after):
+        # Round up, so a client waiting exactly this long is not turned away again
+        retry_after = math.ceil(retry_after * 1000) / 1000
+        super().__init__(REJECTION_MESSAGE.format(reason=reason, retry_after=retry_after))
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Holds up to `burst` tokens, refilled continuously at `rate` per second."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, cost, now):
+        """Take `cost` tokens. Returns 0 on success, or the seconds until there would be enough."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class AdmissionController:
+    """Admits tool calls by per-client token buckets and a global limit on running calls.
+
+    `client_key` is called inside each call to identify its client. A `rate`
+    of 0 turns off per-client limits and a `max_in_flight` of 0 turns off
+    the global limit.
+    """
+
+    def __init__(self, client_key, rate=200.0, burst=None, max_in_flight=64, max_queue=256,
+                 queue_timeout=1.0, costs=None, default_cost=1.0):
+        self.client_key = client_key
+        self.rate = rate
+        self.burst = burst or 2 * rate
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.costs = dict(costs or {})
+        self.default_cost = default_cost
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        # (tool, reason) -> number of calls rejected
+        self.rejections = collections.Counter()
+        # Moving average of how long an admitted call runs, for retry hints
+        self.service_time = 0.01
+        self._buckets = {}
+        self._waiters = collections.deque()
+
+    def cost(self, tool):
+        # A bucket never holds more than `burst`, so no call may cost more
+        return min(self.costs.get(tool, self.default_cost), self.burst)
+
+    def _bucket(self, client, now):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                # A full bucket is the same as a new one, so it can go
+                self._buckets = {key: kept for key, kept in self._buckets.items() if not kept.full(now)}
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def _expected_wait(self, position):
+        # Slots free up at about max_in_flight per service time
+        return (position + 1) * self.service_time / max(1, self.max_in_flight)
+
+    async def acquire(self, tool, client):
+        """Wait for a slot to run `tool` for `client`, or raise Rejected."""
+        cost = self.cost(tool)
+        bucket = None
+        if self.rate > 0:
+            now = time.monotonic()
+            bucket = self._bucket(client, now)
+            wait = bucket.take(cost, now)
+            if wait:
+                raise Rejected("rate_limited", wait)
+        try:
+            await self._enter()
+        except Rejected:
+            # The call never ran, so don't charge the client for it
+            if bucket is not None:
+                bucket.tokens += cost
+            raise
+        self.admitted += 1
+
+    async def _enter(self):
+        if self.max_in_flight <= 0 or (self.in_flight < self.max_in_flight and not self.queued):
+            self.in_flight += 1
+            return
+        position = self.queued
+        if position >= self.max_queue:
+            raise Rejected("queue_full", self._expected_wait(position))
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            # release() hands its slot over by resolving the waiter
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot arrived just as we gave up, so pass it on
+                self.release()
+            else:
+                self.queued -= 1
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    # release() already dropped it
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise Rejected("queue_timeout", self._expected_wait(self.queued)) from None
+            raise
+
+    def release(self, elapsed=None):
+        """Free the caller's slot, handing it to the longest-waiting call if any."""
+        if elapsed is not None:
+            self.service_time += 0.1 * (elapsed - self.service_time)
+        if self.max_in_flight <= 0:
+            self.in_flight -= 1
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.queued -= 1
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def limit(self, tool, raise_rejections=False):
+        """Decorate an async tool handler to run only when admitted.
+
+        A rejected call returns a REJECTION_MESSAGE string instead, or with
+        `raise_rejections` raises Rejected, for handlers such as resource
+        reads whose result can't carry an error.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                try:
+                    await self.acquire(tool, self.client_key())
+                except Rejected as rejection:
+                    self.rejections[(tool, rejection.reason)] += 1
+                    if raise_rejections:
+                        raise
+                    return str(rejection)
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.release(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Return the current load and the rejection counts."""
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": sum(self.rejections.values()),
+            "clients": len(self._buckets),
+            "service_time_s": self.service_time
+        }
+
+
+def parse_costs(text):
+    """Parse "ListNotes=5,CreateNotes=20" into {"ListNotes": 5.0, "CreateNotes": 20.0}."""
+    costs = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        tool, _, cost = item.partition("=")
+        try:
+            costs[tool.strip()] = float(cost)
+        except ValueError:
+            raise ValueError(f"Invalid tool cost: {item!r} (expected Tool=cost)") from None
+    return costs
+
+
+def retry_after(text, anywhere=False):
+    """Return the retry hint in seconds if `text` is a rejection, else None.
+
+    With `anywhere` the rejection may follow other text, as in the error a
+    client gets for a rejected resource read.
+    """
+    match = _RETRY_AFTER.search(text) if anywhere else _RETRY_AFTER.match(text)
+    return float(match.group(2)) if match else None
@@ -0,0 +1,162 @@
+"""Async adapter around the synchronous bedrock-runtime client.
+
+boto3 calls block until the model has answered, which stalls every other
+coroutine on the event loop. AsyncBedrockRuntime runs them on a dedicated
+thread pool instead, and turns the streaming APIs into async iterators so
+tokens can be printed as they arrive.
+
+Importing boto3 and building a client takes a few hundred milliseconds, so
+by default the client is only built for the first call, and runs that never
+call the model (such as cached answers) don't pay for it.
+"""
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+def create_bedrock_client(region_name="us-west-2", max_connections=50):
+    """Build a bedrock-runtime client, or the offline fake if BEDROCK_FAKE is set."""
+    if os.environ.get("BEDROCK_FAKE"):
+        from fake_bedrock import FakeBedrockRuntime
+        return FakeBedrockRuntime(latency=float(os.environ.get("BEDROCK_FAKE_LATENCY", "0")))
+
+    import boto3
+    from botocore.config import Config
+    return boto3.client(
+        service_name='bedrock-runtime',
+        region_name=region_name,
+        # Allow as many HTTP connections as there are worker threads
+        config=Config(max_pool_connections=max_connections)
+    )
+
+
+class AsyncBedrockRuntime:
+    """Awaitable versions of the bedrock-runtime calls used by the examples.
+
+    Without a `client`, one is built with create_bedrock_client() on the
+    first call, on a worker thread, and kept for later calls.
+    """
+
+    def __init__(self, client=None, max_workers=50, region_name="us-west-2"):
+        self.region_name = region_name
+        self.max_workers = max_workers
+        self._client = client
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock")
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = create_bedrock_client(self.region_name, max_connections=self.max_workers)
+        return self._client
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def _iterate(self, start, *args, **kwargs):
+        """Run a blocking stream on a worker thread and yield its events here."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stopped = False
+
+        def pump():
+            try:
+                for event in start(*args, **kwargs):
+                    if stopped:
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+        worker = loop.run_in_executor(self._executor, pump)
+        try:
+            while True:
+                event = await queue.get()
+                if event is _DONE:
+                    break
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            # Let the worker thread stop early if the consumer gave up
+            stopped = True
+            await asyncio.shield(worker)
+
+    async def converse(self, **kwargs):
+        """Call converse without blocking the event loop."""
+        return await self._run(lambda: self.client.converse(**kwargs))
+
+    async def invoke_model(self, **kwargs):
+        """Call invoke_model and return its decoded JSON body."""
+        def call():
+            response = self.client.invoke_model(**kwargs)
+            return json.loads(response['body'].read())
+        return await self._run(call)
+
+    async def converse_stream(self, **kwargs):
+        """Yield the events of a converse_stream call as they arrive."""
+        def start(**kwargs):
+            return self.client.converse_stream(**kwargs)['stream']
+        async for event in self._iterate(start, **kwargs):
+            yield event
+
+    async def invoke_model_with_response_stream(self, **kwargs):
+        """Yield the decoded JSON chunks of an invoke_model_with_response_stream call."""
+        def start(**kwargs):
+            for event in self.client.invoke_model_with_response_stream(**kwargs)['body']:
+                if 'chunk' in event:
+                    yield json.loads(event['chunk']['bytes'])
+        async for event in self._iterate(start, **kwargs):
+            yield event
+
+    async def converse_streaming(self, on_text=None, **kwargs):
+        """Stream a converse call and reassemble it into a converse-style response.
+
+        `on_text` is called with each piece of text as soon as it arrives.
+        """
+        content = {}
+        tool_inputs = {}
+        stop_reason = None
+        usage = {}
+        async for event in self.converse_stream(**kwargs):
+            if 'contentBlockStart' in event:
+                start = event['contentBlockStart']
+                tool_use = start['start'].get('toolUse')
+                if tool_use:
+                    content[start['contentBlockIndex']] = {"toolUse": {**tool_use, "input": {}}}
+                    tool_inputs[start['contentBlockIndex']] = []
+            elif 'contentBlockDelta' in event:
+                index = event['contentBlockDelta']['contentBlockIndex']
+                delta = event['contentBlockDelta']['delta']
+                if 'text' in delta:
+                    block = content.setdefault(index, {"text": ""})
+                    block["text"] += delta['text']
+                    if on_text:
+                        on_text(delta['text'])
+                elif 'toolUse' in delta:
+                    tool_inputs[index].append(delta['toolUse']['input'])
+            elif 'messageStop' in event:
+                stop_reason = event['messageStop']['stopReason']
+            elif 'metadata' in event:
+                usage = event['metadata'].get('usage', {})
+
+        for index, parts in tool_inputs.items():
+            raw_input = "".join(parts)
+            content[index]["toolUse"]["input"] = json.loads(raw_input) if raw_input else {}
+
+        return {
+            "output": {"message": {"role": "assistant", "content": [content[index] for index in sorted(content)]}},
+            "stopReason": stop_reason,
+            "usage": usage
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -1,17 +1,43 @@
-import boto3
 import json
 import asyncio
+import os
 import uuid
-from mcp.client.session import ClientSession
-from mcp.client.sse import sse_client
-import mcp.types as types
+from bedrock_async import AsyncBedrockRuntime
+from mcp_pool import DEFAULT_SERVER_URL, MCPSessionPool, preload_client
+from note_cache import NoteCache
+from prompt_builder import build_notes_context, estimate_tokens, format_note
+from response_cache import ResponseCache, make_cache_key
+from stage_timing import timed
 
-# Initialize Bedrock client
-bedrock_runtime = boto3.client(
-    service_name='bedrock-runtime',
+# Bedrock client, built on the first model call. Calls run on worker threads
+# so they don't block the event loop; set BEDROCK_FAKE=1 to use the offline
+# stub instead of AWS
+bedrock_runtime = AsyncBedrockRuntime(
     region_name='us-west-2'  # Change to your region
 )
 
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"  # Use an appropriate model
+
+# Answers are cached per question and notes version; set BEDROCK_CACHE_PATH
+# to keep them on disk between runs
+response_cache = ResponseCache(
+    ttl=float(os.environ.get("BEDROCK_CACHE_TTL", "3600")),
+    path=os.environ.get("BEDROCK_CACHE_PATH")
+)
+
+# Number of best-matching notes fetched from the server for each question
+SEARCH_LIMIT = 50
+
+# Approximate number of tokens of note text sent with each question
+PROMPT_TOKEN_BUDGET = 4000
+
+# Note IDs listed per call when no note matches the question
+FALLBACK_PAGE_SIZE = 20
+
+def print_text(text):
+    """Print streamed model output as it arrives."""
+    print(text, end="", flush=True)
+
 async def message_handler(message):
     """Handle incoming messages from the server."""
     if isinstance(message, Exception):
@@ -20,34 +46,71 @@ async def message_handler(message):
     
     print(f"Received message from server: {message}")
 
-async def get_notes_from_mcp():
-    """Connect to MCP server and get notes."""
-    async with sse_client("http://localhost:8080/sse") as (read_stream, write_stream):
-        async with ClientSession(
-            read_stream,
-            write_stream,
-            message_handler=message_handler,
-            client_info=types.Implementation(name="BedrockClient", version="1.0.0")
-        ) as session:
-            await session.initialize()
-            
-            # Get notes
-            notes_resource = await session.read_resource("resource://notes")
-            notes_json = notes_resource.contents[0].text
-            notes = json.loads(notes_json)
-            
-            # Read each note
-            note_contents = {}
-            for note_id in notes["note_ids"]:
-                note_result = await session.call_tool("ReadNote", {"note_id": note_id})
-                note_contents[note_id] = note_result.content[0].text
-                
-            return note_contents
-
-def invoke_bedrock_model(prompt, notes):
-    """Invoke Bedrock model with notes information."""
-    # Format notes for the model
-    notes_text = "\n".join([f"{note_id}: {content}" for note_id, content in notes.items()])
+# Sessions to the MCP server are opened once and reused across calls
+mcp_pool = MCPSessionPool(
+    DEFAULT_SERVER_URL,
+    client_name="BedrockClient",
+    message_handler=message_handler
+)
+
+# Local copy of note bodies, synced through the server's change log so only
+# new or changed notes are downloaded again; set NOTE_CACHE_PATH to keep it
+# on disk between runs
+note_cache = NoteCache(
+    mcp_pool,
+    max_bytes=int(os.environ.get("NOTE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    path=os.environ.get("NOTE_CACHE_PATH")
+)
+
+async def get_fallback_notes(token_budget=PROMPT_TOKEN_BUDGET):
+    """Get the first notes in ID order, about `token_budget` tokens' worth.
+
+    Used when no note matches the question. No note is then a better match
+    than any other, so reading more than fits in the prompt would only make
+    each such question cost more as the store grows.
+    """
+    await note_cache.sync()
+    notes = {}
+    used = 0
+    cursor = ""
+    while used < token_budget:
+        result = await mcp_pool.call_tool("ListNotes", {"cursor": cursor, "limit": FALLBACK_PAGE_SIZE})
+        listing = json.loads(result.content[0].text)
+        contents = await note_cache.get_many(listing["note_ids"])
+        for note_id in listing["note_ids"]:
+            if note_id in contents and used < token_budget:
+                notes[note_id] = contents[note_id]
+                used += estimate_tokens(format_note(note_id, contents[note_id]))
+        cursor = listing["next_cursor"]
+        if not cursor:
+            break
+    return notes
+
+async def get_notes_version():
+    """Get the server's notes version token, which changes on every write."""
+    version_resource = await mcp_pool.read_resource("resource://notes/version")
+    return json.loads(version_resource.contents[0].text)["version"]
+
+async def search_notes_from_mcp(query, limit=SEARCH_LIMIT):
+    """Get the notes that best match a query, best match first.
+
+    The search returns only IDs and versions; bodies come from the note
+    cache, so only notes that are new or changed since they were last read
+    are downloaded.
+    """
+    await note_cache.sync()
+    search_result = await mcp_pool.call_tool("SearchNotes", {"query": query, "limit": limit, "include_content": False})
+    matches = json.loads(search_result.content[0].text)["results"]
+    contents = await note_cache.get_many(
+        [match["note_id"] for match in matches],
+        versions={match["note_id"]: match["version"] for match in matches}
+    )
+    return {match["note_id"]: contents[match["note_id"]] for match in matches if match["note_id"] in contents}
+
+def build_request(prompt, notes, token_budget=PROMPT_TOKEN_BUDGET):
+    """Build the invoke_model request for a question, with the most relevant notes as context."""
+    # Format the most relevant notes for the model, within the token budget
+    notes_text = build_notes_context(prompt, notes, token_budget)
     
     # Create the full prompt with notes context
     full_prompt = f"""You are a helpful assistant with access to the following notes:
@@ -59,10 +122,9 @@ Please answer the user's question based on these notes.
 User question: {prompt}
 """
     
-    # Call Bedrock with Claude model
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",  # Use an appropriate model
-        body=json.dumps({
+    return {
+        "modelId": MODEL_ID,
+        "body": json.dumps({
             "anthropic_version": "bedrock-2023-05-31",
             "max_tokens": 1000,
             "messages": [
@@ -72,28 +134,77 @@ User question: {prompt}
                 }
             ]
         })
-    )
+    }
+
+async def invoke_bedrock_model(prompt, notes, on_text=None, token_budget=PROMPT_TOKEN_BUDGET):
+    """Invoke Bedrock model with notes information.
+
+    Only the notes most relevant to the prompt are included, up to about
+    `token_budget` tokens. If `on_text` is given the response is streamed
+    and `on_text` is called with each piece of text as it arrives.
+    """
+    with timed("prompt_assembly"):
+        request = build_request(prompt, notes, token_budget)
     
-    # Parse and return the response
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text']
+    with timed("model_call"):
+        if on_text is None:
+            # Call Bedrock with Claude model and return the whole answer at once
+            response_body = await bedrock_runtime.invoke_model(**request)
+            return response_body['content'][0]['text']
+        
+        # Stream the answer, passing each text delta on as soon as it arrives
+        answer = []
+        async for chunk in bedrock_runtime.invoke_model_with_response_stream(**request):
+            if chunk['type'] == 'content_block_delta' and chunk['delta']['type'] == 'text_delta':
+                answer.append(chunk['delta']['text'])
+                on_text(chunk['delta']['text'])
+        return "".join(answer)
+
+async def answer_question(question, on_text=None):
+    """Answer a question about the notes, reusing a cached answer when possible.
+
+    The cache key includes the notes version, so an answer is only reused
+    while the notes are unchanged. A cached answer is passed to `on_text` in
+    one piece.
+    """
+    notes_version = await get_notes_version()
+    cache_key = make_cache_key(MODEL_ID, question, notes_version, token_budget=PROMPT_TOKEN_BUDGET)
+    answer = response_cache.get(cache_key)
+    if answer is not None:
+        if on_text:
+            on_text(answer)
+        return answer
+    
+    # Get the notes relevant to the question from MCP server
+    notes = await search_notes_from_mcp(question)
+    if not notes:
+        # Nothing matched the question's words, so send whichever notes fit
+        notes = await get_fallback_notes()
+    
+    answer = await invoke_bedrock_model(question, notes, on_text=on_text)
+    response_cache.set(cache_key, answer)
+    return answer
 
 async def main():
+    # Import the MCP client while the user types
+    preload_client()
+    
     # Get user input
     user_question = input("Ask a question about your notes: ")
     
-    # Get notes from MCP server
-    print("Fetching notes from MCP server...")
-    notes = await get_notes_from_mcp()
-    print(f"Retrieved {len(notes)} notes")
-    
-    # Call Bedrock with the notes context
-    print("Asking Bedrock...")
-    answer = invoke_bedrock_model(user_question, notes)
-    
-    # Display the answer
+    # Fetch the relevant notes and call Bedrock, printing the answer as it
+    # streams in (or straight from the cache if the notes haven't changed)
+    print("Asking Bedrock about your notes...")
     print("\nBedrock's answer:")
-    print(answer)
+    try:
+        await answer_question(user_question, on_text=print_text)
+    finally:
+        await mcp_pool.close()
+        response_cache.close()
+        note_cache.close()
+    print()
+    print(f"Response cache: {response_cache.stats()}")
+    print(f"Note cache: {note_cache.stats()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,17 +1,23 @@
-import boto3
 import json
 import asyncio
+import os
 import uuid
-from mcp.client.session import ClientSession
-from mcp.client.sse import sse_client
-import mcp.types as types
+from bedrock_async import AsyncBedrockRuntime
+from mcp_pool import DEFAULT_SERVER_URL, MCPSessionPool, preload_client
+from response_cache import ResponseCache, make_cache_key
+from stage_timing import timed
 
-# Initialize Bedrock client
-bedrock_runtime = boto3.client(
-    service_name='bedrock-runtime',
+# Bedrock client, built on the first model call. Calls run on worker threads
+# so they don't block the event loop; set BEDROCK_FAKE=1 to use the offline
+# stub instead of AWS
+bedrock_runtime = AsyncBedrockRuntime(
     region_name='us-west-2'  # Change to your region
 )
 
+def print_text(text):
+    """Print streamed model output as it arrives."""
+    print(text, end="", flush=True)
+
 async def message_handler(message):
     """Handle incoming messages from the server."""
     if isinstance(message, Exception):
@@ -20,220 +26,206 @@ async def message_handler(message):
     
     print(f"Received message from server: {message}")
 
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"  # Use an appropriate model
+
+# Maximum number of tool calls from one model turn that run at the same time
+MAX_TOOL_CONCURRENCY = 8
+
+# Maximum number of model calls made to answer one question
+MAX_TURNS = 10
+
+# Bedrock tool definitions, built from the MCP server's tools on first use;
+# the lock makes concurrent first callers share one list_tools() call
+_tool_config = None
+_tool_config_lock = asyncio.Lock()
+
+# Model responses are cached per conversation and notes version; set
+# BEDROCK_CACHE_PATH to keep them on disk between runs
+response_cache = ResponseCache(
+    ttl=float(os.environ.get("BEDROCK_CACHE_TTL", "3600")),
+    path=os.environ.get("BEDROCK_CACHE_PATH")
+)
+
+# Sessions to the MCP server are opened once and reused across tool calls
+mcp_pool = MCPSessionPool(
+    DEFAULT_SERVER_URL,
+    client_name="BedrockClient",
+    message_handler=message_handler,
+    max_sessions=MAX_TOOL_CONCURRENCY
+)
+
 async def call_mcp_tool(tool_name, arguments):
     """Call a specific MCP tool."""
-    async with sse_client("http://localhost:8080/sse") as (read_stream, write_stream):
-        async with ClientSession(
-            read_stream,
-            write_stream,
-            message_handler=message_handler,
-            client_info=types.Implementation(name="BedrockClient", version="1.0.0")
-        ) as session:
-            await session.initialize()
-            
-            # Call the tool
-            result = await session.call_tool(tool_name, arguments)
-            return result.content[0].text
-
-def invoke_bedrock_with_tools(prompt):
-    """Invoke Bedrock model with tool definitions."""
-    # Define the tools that match our MCP server
-    tools = [
-        {
-            "toolSpec": {
-                "name": "ReadNote",
-                "description": "Read a specific note by its ID.",
-                "inputSchema": {
-                    "json": {
-                        "type": "object",
-                        "properties": {
-                            "note_id": {
-                                "type": "string",
-                                "description": "The ID of the note to read"
-                            }
-                        },
-                        "required": ["note_id"]
-                    }
-                }
-            }
-        },
-        {
-            "toolSpec": {
-                "name": "CreateNote",
-                "description": "Create a new note with the given ID and content.",
-                "inputSchema": {
-                    "json": {
-                        "type": "object",
-                        "properties": {
-                            "note_id": {
-                                "type": "string",
-                                "description": "The ID for the new note"
-                            },
-                            "content": {
-                                "type": "string",
-                                "description": "The content of the new note"
-                            }
-                        },
-                        "required": ["note_id", "content"]
-                    }
-                }
-            }
-        }
-    ]
+    result = await mcp_pool.call_tool(tool_name, arguments)
+    return result.content[0].text
+
+async def get_notes_version():
+    """Get the server's notes version token, which changes on every write."""
+    result = await mcp_pool.read_resource("resource://notes/version")
+    return json.loads(result.contents[0].text)["version"]
+
+async def converse(modelId, messages, toolConfig, notes_version, on_text=None):
+    """Call converse, streaming the response through `on_text` if it is given.
+
+    Responses are cached by model, conversation, tools and notes version.
+    Tool calls in a cached response still run against the server, so their
+    side effects aren't skipped.
+    """
+    with timed("prompt_assembly"):
+        tool_names = [tool["toolSpec"]["name"] for tool in toolConfig["tools"]]
+        cache_key = make_cache_key(modelId, messages, notes_version, tools=tool_names)
+    response = response_cache.get(cache_key)
+    if response is not None:
+        if on_text:
+            for item in response['output']['message']['content']:
+                if 'text' in item:
+                    on_text(item['text'])
+        return response
     
-    # Call Bedrock with Claude model and tools
-    response = bedrock_runtime.converse(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",  # Use an appropriate model
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": prompt
-                    }
-                ]
-            }
-        ],
-        toolConfig={
-            "tools": tools
-        }
-    )
+    with timed("model_call"):
+        if on_text is None:
+            response = await bedrock_runtime.converse(modelId=modelId, messages=messages, toolConfig=toolConfig)
+        else:
+            response = await bedrock_runtime.converse_streaming(
+                on_text=on_text, modelId=modelId, messages=messages, toolConfig=toolConfig
+            )
     
+    # Only keep the parts of the response that are JSON-serializable and stable
+    response = {key: response[key] for key in ('output', 'stopReason', 'usage') if key in response}
+    response_cache.set(cache_key, response)
     return response
 
-async def handle_tool_calls(response):
-    """Handle any tool calls from the model response."""
-    # Check if the response contains tool use
-    output = response.get('output', {})
-    message = output.get('message', {})
-    content = message.get('content', [])
-    
-    # Look for tool use in the content
-    tool_uses = [item for item in content if 'toolUse' in item]
+async def run_tool_calls(tool_uses, max_concurrency=MAX_TOOL_CONCURRENCY):
+    """Call the MCP tools for a list of toolUse blocks concurrently.
+
+    Returns one toolResult content block per toolUse, in the same order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
     
-    if tool_uses:
-        # Define the tools again for the follow-up call
-        tools = [
-            {
-                "toolSpec": {
-                    "name": "ReadNote",
-                    "description": "Read a specific note by its ID.",
-                    "inputSchema": {
-                        "json": {
-                            "type": "object",
-                            "properties": {
-                                "note_id": {
-                                    "type": "string",
-                                    "description": "The ID of the note to read"
-                                }
-                            },
-                            "required": ["note_id"]
-                        }
-                    }
-                }
-            },
-            {
-                "toolSpec": {
-                    "name": "CreateNote",
-                    "description": "Create a new note with the given ID and content.",
-                    "inputSchema": {
-                        "json": {
-                            "type": "object",
-                            "properties": {
-                                "note_id": {
-                                    "type": "string",
-                                    "description": "The ID for the new note"
-                                },
-                                "content": {
-                                    "type": "string",
-                                    "description": "The content of the new note"
-                                }
-                            },
-                            "required": ["note_id", "content"]
-                        }
+    async def run_one(tool_use):
+        tool_name = tool_use['name']
+        tool_args = tool_use['input']
+        print(f"Model wants to call tool: {tool_name} with args: {tool_args}")
+        
+        async with semaphore:
+            try:
+                result = await call_mcp_tool(tool_name, tool_args)
+            except Exception as e:
+                # Report the failure to the model instead of dropping the turn
+                return {
+                    "toolResult": {
+                        "toolUseId": tool_use['toolUseId'],
+                        "content": [{"text": f"Error calling {tool_name}: {e}"}],
+                        "status": "error"
                     }
                 }
-            }
-        ]
         
-        for tool_use_item in tool_uses:
-            tool_use = tool_use_item['toolUse']
-            tool_name = tool_use['name']
-            tool_args = tool_use['input']
-            tool_use_id = tool_use['toolUseId']
-            
-            print(f"Model wants to call tool: {tool_name} with args: {tool_args}")
-            
-            # Call the MCP tool
-            result = await call_mcp_tool(tool_name, tool_args)
-            
-            # Prepare messages for follow-up call
-            messages = [
-                {
-                    "role": "user",
-                    "content": [{"text": "Please help me with my notes."}]
-                },
-                {
-                    "role": "assistant",
-                    "content": content
-                },
-                {
-                    "role": "user",
-                    "content": [
+        return {
+            "toolResult": {
+                "toolUseId": tool_use['toolUseId'],
+                "content": [{"text": result}]
+            }
+        }
+    
+    return await asyncio.gather(*(run_one(item['toolUse']) for item in tool_uses))
+
+async def get_tool_config():
+    """Build the Bedrock toolConfig from the MCP server's tool list.
+
+    The tool schemas are fetched once and cached for the rest of the process.
+    """
+    global _tool_config
+    if _tool_config is None:
+        async with _tool_config_lock:
+            if _tool_config is None:
+                async with mcp_pool.session() as session:
+                    with timed("list_tools"):
+                        result = await session.list_tools()
+                _tool_config = {
+                    "tools": [
                         {
-                            "toolResult": {
-                                "toolUseId": tool_use_id,
-                                "content": [{"text": result}]
+                            "toolSpec": {
+                                "name": tool.name,
+                                "description": tool.description or tool.name,
+                                "inputSchema": {"json": tool.inputSchema}
                             }
                         }
+                        for tool in result.tools
                     ]
                 }
-            ]
-            
-            # Send the tool result back to the model
-            follow_up_response = bedrock_runtime.converse(
-                modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                messages=messages,
-                toolConfig={
-                    "tools": tools
-                }
-            )
-            
-            # Check if there are more tool calls
-            follow_up_output = follow_up_response.get('output', {})
-            follow_up_message = follow_up_output.get('message', {})
-            follow_up_content = follow_up_message.get('content', [])
-            follow_up_tool_uses = [item for item in follow_up_content if 'toolUse' in item]
-            
-            if follow_up_tool_uses:
-                return await handle_tool_calls(follow_up_response)
-            else:
-                return follow_up_response
+    return _tool_config
+
+async def run_agent(prompt, max_turns=MAX_TURNS, max_concurrency=MAX_TOOL_CONCURRENCY, on_text=None):
+    """Let the model call MCP tools until it answers the prompt.
+
+    Each turn sends the whole conversation so far, runs the tools the model
+    asked for and appends their results. Stops when the model replies
+    without tool calls or after `max_turns` model calls, and returns the
+    last response together with the conversation history.
+    """
+    tool_config = await get_tool_config()
+    messages = [
+        {
+            "role": "user",
+            "content": [{"text": prompt}]
+        }
+    ]
     
-    return response
+    for _ in range(max_turns):
+        # Re-read the version each turn, as the previous turn's tools may have written notes
+        notes_version = await get_notes_version()
+        response = await converse(
+            MODEL_ID,
+            messages,
+            tool_config,
+            notes_version,
+            on_text=on_text
+        )
+        message = response['output']['message']
+        messages.append(message)
+        
+        # Look for tool use in the content
+        tool_uses = [item for item in message['content'] if 'toolUse' in item]
+        if not tool_uses:
+            break
+        
+        # Run every tool the model asked for in this turn concurrently and
+        # send all the results back in one message
+        tool_results = await run_tool_calls(tool_uses, max_concurrency)
+        messages.append({
+            "role": "user",
+            "content": tool_results
+        })
+    else:
+        print(f"\nStopped after {max_turns} turns without a final answer")
+    
+    return response, messages
 
 async def main():
+    # Import the MCP client while the user types
+    preload_client()
+    
     # Get user input
     user_question = input("Ask a question about your notes: ")
     
-    # Call Bedrock with tools
+    # Run the agent loop, printing text as it streams in
     print("Asking Bedrock...")
-    initial_response = invoke_bedrock_with_tools(user_question)
-    
-    # Handle any tool calls
-    final_response = await handle_tool_calls(initial_response)
-    
-    # Display the answer
     print("\nBedrock's answer:")
+    try:
+        final_response, _ = await run_agent(user_question, on_text=print_text)
+    finally:
+        await mcp_pool.close()
+        response_cache.close()
+    print()
+    print(f"Response cache: {response_cache.stats()}")
+    
     output = final_response.get('output', {})
     message = output.get('message', {})
     content = message.get('content', [])
     
-    # Extract text content from the response
+    # Text was already printed while streaming; show anything else
     for item in content:
-        if 'text' in item:
-            print(item['text'])
-        elif 'toolUse' in item:
+        if 'toolUse' in item:
             print(f"Tool call: {item['toolUse']['name']}")
         elif 'toolResult' in item:
             print(f"Tool result: {item['toolResult']}")
@@ -0,0 +1,269 @@
+"""Load test for the Notes MCP server.
+
+Starts notes_server.py locally for each corpus size, seeds it with notes,
+then runs many concurrent MCP sessions issuing a weighted mix of
+operations and reports throughput and latency percentiles.
+
+Example:
+    python benchmark_server.py --sizes 1000,100000 --sessions 32 \\
+        --mix read=80,create=10,list=10 --output results.json
+
+Add --production --workers N --store sqlite to benchmark the multi-process
+production mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from admission import retry_after
+from mcp_pool import MCPSessionPool, call_tool_admitted
+
+OPERATIONS = ("read", "read_batch", "create", "list", "search")
+
+
+def parse_mix(text):
+    """Parse "read=80,create=10,list=10" into a dict of operation weights."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {name} (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, rejected=0):
+    """Turn raw latencies (seconds) into throughput and percentile figures (ms)."""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rejected": rejected,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3) if values else None,
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3) if values else None,
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3) if values else None,
+        "max_ms": round(values[-1] * 1000, 3) if values else None
+    }
+
+
+class ServerProcess:
+    """Runs notes_server.py in a subprocess on a given port."""
+
+    def __init__(self, port, store, production=False, workers=1, extra_env=None):
+        self.port = port
+        self.store = store
+        self.production = production
+        self.workers = workers
+        self.extra_env = extra_env or {}
+        self.process = None
+        self._tmpdir = None
+
+    async def __aenter__(self):
+        env = dict(os.environ, NOTES_PORT=str(self.port), NOTES_STORE=self.store, **self.extra_env)
+        if self.store == "sqlite":
+            self._tmpdir = tempfile.TemporaryDirectory()
+            env["NOTES_DB_PATH"] = os.path.join(self._tmpdir.name, "notes.db")
+        elif self.store == "wal":
+            self._tmpdir = tempfile.TemporaryDirectory()
+            env["NOTES_WAL_DIR"] = os.path.join(self._tmpdir.name, "wal")
+        server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "notes_server.py")
+        command = [sys.executable, server_path]
+        if self.production:
+            command += ["--production", "--workers", str(self.workers)]
+        self.process = subprocess.Popen(
+            command,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        await self._wait_ready()
+        return self
+
+    async def _wait_ready(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {self.process.returncode}")
+                try:
+                    response = await client.get(f"http://127.0.0.1:{self.port}/")
+                    if response.status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError("Server did not start in time")
+
+    async def __aexit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+
+async def seed_corpus(pool, size, body_words, batch_size=1000):
+    """Create `size` notes named bench-0 ... bench-N through CreateNotes."""
+    vocabulary = [f"word{i}" for i in range(5000)]
+    rng = random.Random(0)
+    async with pool.session() as session:
+        for start in range(0, size, batch_size):
+            batch = [
+                {"note_id": f"bench-{i}", "content": " ".join(rng.choices(vocabulary, k=body_words))}
+                for i in range(start, min(size, start + batch_size))
+            ]
+            await call_tool_admitted(session, "CreateNotes", {"notes": batch})
+    return vocabulary
+
+
+async def run_worker(pool, worker_id, mix, corpus_size, vocabulary, deadline, results):
+    """Issue operations on one session until the deadline, recording latencies."""
+    rng = random.Random(worker_id)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    created = 0
+    async with pool.session() as session:
+        while time.monotonic() < deadline:
+            operation = rng.choices(names, weights)[0]
+            if operation == "read":
+                call = session.call_tool("ReadNote", {"note_id": f"bench-{rng.randrange(corpus_size)}"})
+            elif operation == "read_batch":
+                note_ids = [f"bench-{rng.randrange(corpus_size)}" for _ in range(50)]
+                call = session.call_tool("ReadNotes", {"note_ids": note_ids})
+            elif operation == "create":
+                created += 1
+                call = session.call_tool("CreateNote", {"note_id": f"load-{worker_id}-{created}", "content": "load test note"})
+            elif operation == "list":
+                call = session.read_resource("resource://notes")
+            else:
+                call = session.call_tool("SearchNotes", {"query": " ".join(rng.sample(vocabulary, 2)), "limit": 10})
+            started = time.perf_counter()
+            try:
+                result = await call
+                failed = getattr(result, "isError", False)
+            except Exception:
+                failed = True
+            latency = time.perf_counter() - started
+            content = getattr(result, "content", None) if not failed else None
+            if content and retry_after(getattr(content[0], "text", "")) is not None:
+                # Turned away by admission control; the latency isn't a served request's
+                results[operation]["rejected"] += 1
+            elif failed:
+                results[operation]["errors"] += 1
+            else:
+                results[operation]["latencies"].append(latency)
+
+
+async def run_scenario(args, corpus_size, port):
+    """Benchmark one corpus size against a freshly started server."""
+    extra_env = {"NOTES_DURABILITY": args.durability}
+    if args.rate_limit is not None:
+        extra_env["NOTES_RATE_LIMIT"] = str(args.rate_limit)
+    async with ServerProcess(port, args.store, production=args.production, workers=args.workers, extra_env=extra_env):
+        url = f"http://127.0.0.1:{port}/mcp" if args.production else f"http://127.0.0.1:{port}/sse"
+        async with MCPSessionPool(url, client_name="Benchmark", max_sessions=args.sessions) as pool:
+            print(f"Seeding {corpus_size} notes...", file=sys.stderr)
+            vocabulary = await seed_corpus(pool, corpus_size, args.body_words)
+
+            print(f"Running {args.sessions} sessions for {args.duration}s...", file=sys.stderr)
+            results = {operation: {"latencies": [], "errors": 0, "rejected": 0} for operation in args.mix}
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(*(
+                run_worker(pool, worker_id, args.mix, corpus_size, vocabulary, deadline, results)
+                for worker_id in range(args.sessions)
+            ))
+            elapsed = time.monotonic() - started
+
+    all_latencies = [value for result in results.values() for value in result["latencies"]]
+    return {
+        "corpus_size": corpus_size,
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize(
+            all_latencies, sum(result["errors"] for result in results.values()), elapsed,
+            sum(result["rejected"] for result in results.values())
+        ),
+        "operations": {
+            operation: summarize(result["latencies"], result["errors"], elapsed, result["rejected"])
+            for operation, result in results.items()
+        }
+    }
+
+
+def print_table(report):
+    print(f"{'corpus':>10} {'operation':>10} {'requests':>9} {'errors':>7} {'rejected':>9} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for scenario in report["scenarios"]:
+        rows = list(scenario["operations"].items()) + [("overall", scenario["overall"])]
+        for operation, stats in rows:
+            print(
+                f"{scenario['corpus_size']:>10} {operation:>10} {stats['requests']:>9} {stats['errors']:>7} {stats['rejected']:>9} "
+                f"{stats['throughput_rps']:>9} {stats['p50_ms'] or '-':>9} {stats['p95_ms'] or '-':>9} {stats['p99_ms'] or '-':>9}"
+            )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the Notes MCP server.")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated corpus sizes to test")
+    parser.add_argument("--sessions", type=int, default=16, help="Number of concurrent MCP sessions")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run each corpus size")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("read=80,create=10,list=10"),
+                        help=f"Weighted operation mix, from: {', '.join(OPERATIONS)}")
+    parser.add_argument("--store", choices=["memory", "wal", "sqlite"], default="memory", help="Server storage backend")
+    parser.add_argument("--durability", choices=["none", "batched", "per-write"], default="batched",
+                        help="Write-ahead log durability level (with --store wal)")
+    parser.add_argument("--rate-limit", type=float,
+                        help="Server's per-session rate limit in cost units per second (0 turns it off)")
+    parser.add_argument("--production", action="store_true",
+                        help="Run the server in production mode (streamable HTTP, quiet logging)")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes (with --production)")
+    parser.add_argument("--body-words", type=int, default=50, help="Words per seeded note")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the benchmark server")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    args = parser.parse_args()
+
+    report = {
+        "config": {
+            "sessions": args.sessions,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "store": args.store,
+            "durability": args.durability,
+            "rate_limit": args.rate_limit,
+            "production": args.production,
+            "workers": args.workers,
+            "body_words": args.body_words
+        },
+        "scenarios": []
+    }
+    for corpus_size in [int(size) for size in args.sizes.split(",")]:
+        report["scenarios"].append(await run_scenario(args, corpus_size, args.port))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print_table(report)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
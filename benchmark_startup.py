@@ -0,0 +1,200 @@
+"""Startup benchmark for the server and the example clients.
+
+Short-lived runs (one question from the command line, a serverless cold
+start) pay for imports and connection setup on every invocation. For each
+entry point this starts fresh Python processes and records:
+
+- import_ms: time to import the module
+- first_request_ms: time from the end of the import to the first answer.
+  For the clients that is one question (or, for test_client.py, the whole
+  script) against a local server. The import sees the real Bedrock
+  settings and the offline stub is only switched on for the request. For
+  the server it is from the end of its import until it answers a ReadNote.
+- process_ms: wall time of the whole process as seen from outside, from
+  spawning it until the first request is done
+- Whether boto3 and the MCP client were imported by the import alone
+
+Example:
+    python benchmark_startup.py --runs 5 --output startup.json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+QUESTION = "What does note1 say about milk?"
+
+# What the first request of each client entry point is
+FIRST_REQUESTS = {
+    "bedrock_integration": lambda module: module.answer_question(QUESTION),
+    "bedrock_tool_calling": lambda module: module.run_agent(QUESTION),
+    "test_client": lambda module: module.main()
+}
+ENTRY_POINTS = ["notes_server", *FIRST_REQUESTS]
+
+# Modules whose presence after the import shows what was loaded eagerly
+WATCHED_MODULES = {"boto3": "boto3", "mcp_client": "mcp.client.session"}
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+async def close_clients(module):
+    for name in ("mcp_pool", "note_cache", "response_cache"):
+        resource = getattr(module, name, None)
+        if resource is None:
+            continue
+        closed = resource.close()
+        if asyncio.iscoroutine(closed):
+            await closed
+
+
+def run_child(entry_point):
+    """Time the import and first request of one entry point in this process.
+
+    The result goes to stderr as the last line, since the clients print to stdout.
+    """
+    started = time.perf_counter()
+    module = importlib.import_module(entry_point)
+    imported = time.perf_counter()
+    result = {
+        "import_ms": (imported - started) * 1000,
+        **{name: module_name in sys.modules for name, module_name in WATCHED_MODULES.items()}
+    }
+    if entry_point in FIRST_REQUESTS:
+        os.environ["BEDROCK_FAKE"] = "1"
+
+        async def first_request():
+            try:
+                await FIRST_REQUESTS[entry_point](module)
+            finally:
+                await close_clients(module)
+        asyncio.run(first_request())
+        result["first_request_ms"] = (time.perf_counter() - imported) * 1000
+    print(json.dumps(result), file=sys.stderr)
+
+
+def spawn(entry_point, env):
+    """Run one entry point in a fresh interpreter and return its measurements."""
+    started = time.perf_counter()
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", entry_point],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - started
+    if child.returncode != 0:
+        raise RuntimeError(f"{entry_point} failed:\n{child.stderr}")
+    return {**json.loads(child.stderr.strip().splitlines()[-1]), "process_ms": elapsed * 1000}
+
+
+async def time_server(port, env):
+    """Start notes_server.py and time how long it takes to answer a ReadNote."""
+    # Import the MCP client now, so its import isn't counted against the server
+    import mcp.client.sse  # noqa: F401
+    from mcp_pool import MCPSessionPool
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "notes_server.py")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, server_path], env=dict(env, NOTES_PORT=str(port)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                async with MCPSessionPool(f"http://127.0.0.1:{port}/sse") as pool:
+                    await pool.call_tool("ReadNote", {"note_id": "note1"}, retries=0)
+                break
+            except Exception:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Server did not start in time") from None
+                await asyncio.sleep(0.01)
+        return (time.perf_counter() - started) * 1000
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure import and first-request latency of each entry point.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per entry point")
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS),
+                        help=f"Comma-separated entry points, from: {', '.join(ENTRY_POINTS)}")
+    parser.add_argument("--bedrock-latency", type=float, default=0.0, help="Seconds the Bedrock stub takes per call")
+    parser.add_argument("--port", type=int, default=8766, help="Port for the local server")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    args = parser.parse_args()
+    # Imported here so that the child processes don't pay for it
+    from benchmark_server import ServerProcess
+
+    env = dict(
+        os.environ,
+        NOTES_STORE="memory",
+        NOTES_SERVER_URL=f"http://127.0.0.1:{args.port}/sse",
+        BEDROCK_FAKE_LATENCY=str(args.bedrock_latency)
+    )
+    for name in ("BEDROCK_FAKE", "BEDROCK_CACHE_PATH", "NOTE_CACHE_PATH"):
+        env.pop(name, None)
+
+    # A bare interpreter, to tell Python's own startup apart from ours
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    report = {
+        "config": {"runs": args.runs, "bedrock_latency_s": args.bedrock_latency, "python": sys.version.split()[0]},
+        "interpreter_ms": round((time.perf_counter() - started) * 1000, 1),
+        "entry_points": {}
+    }
+    entry_points = args.entry_points.split(",")
+    runs = {entry_point: [] for entry_point in entry_points}
+    if "notes_server" in runs:
+        for _ in range(args.runs):
+            measured = spawn("notes_server", env)
+            process_ms = await time_server(args.port, env)
+            runs["notes_server"].append({**measured, "process_ms": process_ms,
+                                         "first_request_ms": process_ms - measured["process_ms"]})
+    clients = [entry_point for entry_point in entry_points if entry_point in FIRST_REQUESTS]
+    if clients:
+        async with ServerProcess(args.port, "memory"):
+            for entry_point in clients:
+                for _ in range(args.runs):
+                    runs[entry_point].append(spawn(entry_point, env))
+
+    for entry_point, measurements in runs.items():
+        report["entry_points"][entry_point] = {
+            key: round(median([run[key] for run in measurements]), 1)
+            for key in ("import_ms", "first_request_ms", "process_ms")
+        }
+        report["entry_points"][entry_point].update({
+            f"imports_{name}": any(run[name] for run in measurements) for name in WATCHED_MODULES
+        })
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print_table(report)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+def print_table(report):
+    print(f"{'entry point':>22} {'import ms':>10} {'first req ms':>13} {'process ms':>11} {'boto3':>6} {'mcp client':>11}")
+    for entry_point, stats in report["entry_points"].items():
+        print(
+            f"{entry_point:>22} {stats['import_ms']:>10} {stats['first_request_ms']:>13} {stats['process_ms']:>11} "
+            f"{'yes' if stats['imports_boto3'] else 'no':>6} {'yes' if stats['imports_mcp_client'] else 'no':>11}"
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        run_child(sys.argv[2])
+    else:
+        asyncio.run(main())
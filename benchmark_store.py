@@ -0,0 +1,151 @@
+"""Memory and read-latency benchmark for the note stores.
+
+Builds the same corpus as a plain dict and as CompactNotes, then reports
+the memory each one takes per note (measured with tracemalloc) and the
+latency of reading random notes through the store's get().
+
+It then replays a skewed read trace against a SQLite store through each
+read cache policy, reporting hit rates and read latency.
+
+Example:
+    python benchmark_store.py --notes 100000 --words 60 --reads 200000 \\
+        --cache-bytes 4000000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from compact_notes import CompactNotes
+from notes_store import CachedNoteStore, MemoryNoteStore, SQLiteNoteStore
+from read_cache import READ_CACHE_POLICIES, create_read_cache
+
+# Notes in our corpora are mostly built from recurring phrases
+PHRASES = [
+    "Meeting with the {team} team about the {project} roadmap",
+    "Follow up with {person} on the {project} budget review",
+    "Remember to update the {project} status report before {day}",
+    "Action items from the {team} sync: review open tickets, update the docs",
+    "{person} asked for the latest numbers on {project} by {day}",
+    "Draft the quarterly summary for {team} and share it with {person}",
+    "Buy milk and eggs on the way home on {day}",
+    "Call {person} about the {project} launch plan"
+]
+FILLS = {
+    "team": ["platform", "search", "billing", "mobile", "data", "security"],
+    "project": ["Atlas", "Beacon", "Comet", "Delta", "Ember", "Falcon", "Granite"],
+    "person": ["Alex", "Sam", "Jordan", "Riley", "Casey", "Morgan", "Taylor"],
+    "day": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+}
+
+
+def make_corpus(size, words, seed=0):
+    """Build `size` notes of roughly `words` words each from recurring phrases."""
+    rng = random.Random(seed)
+    notes = {}
+    for i in range(size):
+        sentences = []
+        while sum(len(sentence.split()) for sentence in sentences) < words:
+            phrase = rng.choice(PHRASES)
+            sentences.append(phrase.format(**{key: rng.choice(values) for key, values in FILLS.items()}) + ".")
+        notes[f"note-{i}"] = " ".join(sentences)
+    return notes
+
+
+def measure(build):
+    """Return (object, bytes allocated while building it)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, after - before
+
+
+def make_skewed_trace(note_ids, reads, skew=1.0, scan_fraction=0.2, seed=2):
+    """Note IDs to read: Zipf-distributed hot reads mixed with scans over cold notes."""
+    rng = random.Random(seed)
+    ranked = list(note_ids)
+    rng.shuffle(ranked)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(len(ranked))))
+    scan = itertools.cycle(ranked[len(ranked) // 2:])
+    trace = []
+    while len(trace) < reads:
+        if rng.random() < scan_fraction:
+            # A scan reads a run of notes that are otherwise rarely touched
+            trace.extend(next(scan) for _ in range(100))
+        else:
+            trace.extend(rng.choices(ranked, cum_weights=cum_weights, k=100))
+    return trace[:reads]
+
+
+async def read_latency(store, trace):
+    """Time a store.get() for every ID in `trace`, returning latency percentiles in microseconds."""
+    latencies = []
+    for note_id in trace:
+        started = time.perf_counter()
+        await store.get(note_id)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 2),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 2),
+        "reads_per_s": round(len(trace) / sum(latencies))
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare memory use and read latency of note representations.")
+    parser.add_argument("--notes", type=int, default=100_000, help="Number of notes in the corpus")
+    parser.add_argument("--words", type=int, default=60, help="Approximate words per note")
+    parser.add_argument("--reads", type=int, default=100_000, help="Random reads to time per representation")
+    parser.add_argument("--threshold", type=int, default=128, help="CompactNotes small-body threshold in bytes")
+    parser.add_argument("--cache-bytes", type=int, default=4_000_000, help="Read cache size for the SQLite runs")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the skewed read trace")
+    args = parser.parse_args()
+
+    # Copy the corpus inside each measurement so both pay for their own strings
+    source = make_corpus(args.notes, args.words)
+    text_bytes = sum(len(content.encode()) for content in source.values())
+    representations = {
+        "dict": lambda: {str(note_id): "".join(content) for note_id, content in source.items()},
+        "compact": lambda: CompactNotes(source, threshold=args.threshold)
+    }
+
+    report = {"notes": args.notes, "avg_body_bytes": round(text_bytes / args.notes, 1), "results": {}, "read_cache": {}}
+    note_ids = list(source)
+    rng = random.Random(1)
+    uniform_trace = [rng.choice(note_ids) for _ in range(args.reads)]
+    for name, build in representations.items():
+        started = time.perf_counter()
+        notes, allocated = measure(build)
+        build_s = time.perf_counter() - started
+        store = MemoryNoteStore(notes)
+        report["results"][name] = {
+            "bytes_per_note": round(allocated / args.notes, 1),
+            "build_s": round(build_s, 3),
+            **await read_latency(store, uniform_trace)
+        }
+
+    skewed_trace = make_skewed_trace(note_ids, args.reads, skew=args.skew)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        backend = SQLiteNoteStore(os.path.join(tmpdir, "notes.db"), seed=source)
+        for policy in ["none", *READ_CACHE_POLICIES]:
+            cache = create_read_cache(policy, args.cache_bytes)
+            store = CachedNoteStore(backend, cache) if cache is not None else backend
+            latency = await read_latency(store, skewed_trace)
+            report["read_cache"][policy] = {
+                "hit_rate": round(cache.stats()["hit_rate"], 4) if cache is not None else 0.0,
+                **latency
+            }
+        await backend.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""Compact in-memory representation of note contents.
+
+A dict of str values pays for a full Python object per note on top of the
+text itself. CompactNotes is a drop-in replacement for that dict:
+- Note bodies are stored back to back in one bytearray (the arena).
+- The index maps each interned note ID to a single packed int giving the
+  body's offset, length and encoding.
+- Bodies of at least `threshold` bytes are deflate-compressed against a
+  preset dictionary. The dictionary is trained on the first notes
+  stored, so the phrases shared by a repetitive corpus compress well even
+  in short notes.
+- Smaller bodies are kept as plain UTF-8, since compressing them gains
+  little and costs time on every read.
+
+Reads decompress transparently, so stores use it exactly like a dict.
+"""
+import sys
+import zlib
+from collections.abc import MutableMapping
+
+# Amount of note text sampled to build the compression dictionary. zlib
+# can only refer back 32 KiB, so a larger dictionary would not help.
+DICTIONARY_SIZE = 32 * 1024
+
+_RAW = 0
+_COMPRESSED = 1
+
+# Raw deflate: no zlib header or checksum, which would add 6 bytes per note
+_WBITS = -15
+
+
+class CompactNotes(MutableMapping):
+    """Mapping of note ID to content that keeps the contents compressed in an arena."""
+
+    def __init__(self, notes=None, threshold=128, level=6):
+        self.threshold = threshold
+        self.level = level
+        self._arena = bytearray()
+        # note ID -> offset << 32 | length << 1 | encoding
+        self._index = {}
+        # Bytes in the arena no longer referenced by the index
+        self._garbage = 0
+        self._dictionary = None
+        self._compressor = None
+        self._sample = []
+        self._sample_size = 0
+        if notes:
+            self.update(notes)
+
+    def _encode(self, data):
+        if self._dictionary is None or len(data) < self.threshold:
+            return data, _RAW
+        # Copying a compressor already primed with the dictionary is several
+        # times faster than loading the dictionary into a new one
+        compressor = self._compressor.copy()
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) >= len(data):
+            return data, _RAW
+        return compressed, _COMPRESSED
+
+    def _decode(self, packed):
+        offset = packed >> 32
+        length = (packed & 0xFFFFFFFF) >> 1
+        data = self._arena[offset:offset + length]
+        if packed & 1 == _COMPRESSED:
+            data = zlib.decompressobj(_WBITS, zdict=self._dictionary).decompress(data)
+        return data.decode()
+
+    def _append(self, data):
+        encoded, encoding = self._encode(data)
+        if len(encoded) >= 1 << 31:
+            raise ValueError("Note is too large to store")
+        offset = len(self._arena)
+        self._arena += encoded
+        return offset << 32 | len(encoded) << 1 | encoding
+
+    def _learn(self, data):
+        # Notes stored before the dictionary exists stay uncompressed until
+        # it is built, then everything is re-encoded once
+        self._sample.append(data)
+        self._sample_size += len(data)
+        if self._sample_size >= DICTIONARY_SIZE:
+            # zlib favours matches near the end of the dictionary, so the
+            # most recent sample goes last
+            self._dictionary = b"".join(self._sample)[-DICTIONARY_SIZE:]
+            self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, _WBITS, zdict=self._dictionary)
+            self._sample = None
+            self._compress_existing()
+
+    def __setitem__(self, note_id, content):
+        data = content.encode()
+        if self._dictionary is None and len(data) >= self.threshold:
+            self._learn(data)
+        old = self._index.get(note_id)
+        if old is not None:
+            self._garbage += (old & 0xFFFFFFFF) >> 1
+        self._index[sys.intern(note_id)] = self._append(data)
+        self._maybe_compact()
+
+    def __getitem__(self, note_id):
+        return self._decode(self._index[note_id])
+
+    def __delitem__(self, note_id):
+        packed = self._index.pop(note_id)
+        self._garbage += (packed & 0xFFFFFFFF) >> 1
+        self._maybe_compact()
+
+    def __contains__(self, note_id):
+        return note_id in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def _maybe_compact(self):
+        # Rewriting the arena is O(size), so wait until half of it is garbage
+        if self._garbage > 4096 and self._garbage * 2 > len(self._arena):
+            self.compact()
+
+    def _compress_existing(self):
+        # Until the dictionary exists every body is stored raw, so each one
+        # is encoded straight from its slice of the old arena
+        old = memoryview(self._arena)
+        self._arena = bytearray()
+        self._garbage = 0
+        for note_id, packed in self._index.items():
+            offset = packed >> 32
+            self._index[note_id] = self._append(bytes(old[offset:offset + ((packed & 0xFFFFFFFF) >> 1)]))
+        old.release()
+
+    def compact(self):
+        """Rewrite the arena without overwritten or deleted bodies.
+
+        Bodies are copied as stored, without decoding or re-encoding them,
+        so this costs one copy of the live bytes.
+        """
+        old = memoryview(self._arena)
+        arena = bytearray()
+        for note_id, packed in self._index.items():
+            offset = packed >> 32
+            arena_offset = len(arena)
+            arena += old[offset:offset + ((packed & 0xFFFFFFFF) >> 1)]
+            self._index[note_id] = arena_offset << 32 | packed & 0xFFFFFFFF
+        old.release()
+        self._arena = arena
+        self._garbage = 0
+
+    def copy(self):
+        """Return an independent copy, without decompressing anything."""
+        clone = CompactNotes(threshold=self.threshold, level=self.level)
+        clone._arena = bytearray(self._arena)
+        clone._index = dict(self._index)
+        clone._garbage = self._garbage
+        clone._dictionary = self._dictionary
+        clone._compressor = self._compressor
+        clone._sample = list(self._sample) if self._sample is not None else None
+        clone._sample_size = self._sample_size
+        return clone
+
+    def stats(self):
+        """Return the number of notes and the bytes used by the arena and dictionary."""
+        return {
+            "notes": len(self._index),
+            "arena_bytes": len(self._arena),
+            "garbage_bytes": self._garbage,
+            "dictionary_bytes": len(self._dictionary or b"")
+        }
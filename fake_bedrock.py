@@ -0,0 +1,171 @@
+"""Offline stand-in for the boto3 bedrock-runtime client.
+
+FakeBedrockRuntime implements converse, converse_stream, invoke_model and
+invoke_model_with_response_stream with the same request and response shapes
+as boto3, so the examples can run without AWS credentials. Like the real
+client, every call blocks the calling thread for the configured latency.
+"""
+import io
+import json
+import re
+import threading
+import time
+import uuid
+
+NOTE_ID_PATTERN = re.compile(r"\bnote\w+\b")
+
+
+def _last_user_blocks(messages):
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return message["content"]
+    return []
+
+
+def _block_text(block):
+    if isinstance(block, str):
+        return block
+    if "text" in block:
+        return block["text"]
+    if "toolResult" in block:
+        return " ".join(_block_text(item) for item in block["toolResult"]["content"])
+    return ""
+
+
+class FakeBedrockRuntime:
+    """Answers Bedrock calls locally with scripted or synthetic responses.
+
+    `reply` is an optional callable taking (messages, tool_names) and
+    returning a list of Converse content blocks. Without it the fake calls
+    ReadNote for every note ID mentioned in the question (when that tool is
+    offered), then answers with the tool results it got back.
+
+    `latency` is the delay before a response and `token_latency` the delay
+    between streamed chunks, both in seconds.
+    """
+
+    def __init__(self, reply=None, latency=0.0, token_latency=0.0, chunk_words=3):
+        self.reply = reply or self.default_reply
+        self.latency = latency
+        self.token_latency = token_latency
+        self.chunk_words = chunk_words
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def default_reply(self, messages, tool_names):
+        blocks = _last_user_blocks(messages)
+        if any("toolResult" in block for block in blocks):
+            results = "; ".join(_block_text(block) for block in blocks)
+            return [{"text": f"Based on your notes: {results}"}]
+        question = " ".join(_block_text(block) for block in blocks)
+        note_ids = list(dict.fromkeys(NOTE_ID_PATTERN.findall(question)))
+        if note_ids and "ReadNote" in tool_names:
+            return [
+                {"toolUse": {"toolUseId": f"tooluse_{uuid.uuid4().hex[:12]}", "name": "ReadNote", "input": {"note_id": note_id}}}
+                for note_id in note_ids
+            ]
+        return [{"text": f"This is a stubbed answer to: {question.strip()}"}]
+
+    def _respond(self, messages, tool_config):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        tool_names = [tool["toolSpec"]["name"] for tool in (tool_config or {}).get("tools", [])]
+        content = self.reply(messages, tool_names)
+        stop_reason = "tool_use" if any("toolUse" in block for block in content) else "end_turn"
+        return content, stop_reason
+
+    def _chunks(self, text):
+        words = text.split(" ")
+        for start in range(0, len(words), self.chunk_words):
+            chunk = " ".join(words[start:start + self.chunk_words])
+            yield chunk if start == 0 else " " + chunk
+
+    def _usage(self, messages, content):
+        input_tokens = sum(len(_block_text(block).split()) for message in messages for block in message["content"])
+        output_tokens = sum(len(_block_text(block).split()) for block in content)
+        return input_tokens, output_tokens
+
+    def converse(self, modelId, messages, toolConfig=None, **kwargs):
+        content, stop_reason = self._respond(messages, toolConfig)
+        input_tokens, output_tokens = self._usage(messages, content)
+        return {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": stop_reason,
+            "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens, "totalTokens": input_tokens + output_tokens},
+            "metrics": {"latencyMs": int(self.latency * 1000)}
+        }
+
+    def converse_stream(self, modelId, messages, toolConfig=None, **kwargs):
+        content, stop_reason = self._respond(messages, toolConfig)
+        input_tokens, output_tokens = self._usage(messages, content)
+        return {"stream": self._converse_events(content, stop_reason, input_tokens, output_tokens)}
+
+    def _converse_events(self, content, stop_reason, input_tokens, output_tokens):
+        yield {"messageStart": {"role": "assistant"}}
+        for index, block in enumerate(content):
+            if "toolUse" in block:
+                tool_use = block["toolUse"]
+                yield {"contentBlockStart": {"contentBlockIndex": index, "start": {"toolUse": {"toolUseId": tool_use["toolUseId"], "name": tool_use["name"]}}}}
+                yield {"contentBlockDelta": {"contentBlockIndex": index, "delta": {"toolUse": {"input": json.dumps(tool_use["input"])}}}}
+            else:
+                for chunk in self._chunks(block["text"]):
+                    time.sleep(self.token_latency)
+                    yield {"contentBlockDelta": {"contentBlockIndex": index, "delta": {"text": chunk}}}
+            yield {"contentBlockStop": {"contentBlockIndex": index}}
+        yield {"messageStop": {"stopReason": stop_reason}}
+        yield {"metadata": {
+            "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens, "totalTokens": input_tokens + output_tokens},
+            "metrics": {"latencyMs": int(self.latency * 1000)}
+        }}
+
+    def _anthropic_messages(self, body):
+        request = json.loads(body)
+        messages = []
+        for message in request["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"text": content}]
+            messages.append({"role": message["role"], "content": [{"text": _block_text(block)} for block in content]})
+        return messages
+
+    def invoke_model(self, modelId, body, **kwargs):
+        messages = self._anthropic_messages(body)
+        content, _ = self._respond(messages, None)
+        text = "".join(_block_text(block) for block in content)
+        input_tokens, output_tokens = self._usage(messages, content)
+        response = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": modelId,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        }
+        return {"body": io.BytesIO(json.dumps(response).encode()), "contentType": "application/json"}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        messages = self._anthropic_messages(body)
+        content, _ = self._respond(messages, None)
+        text = "".join(_block_text(block) for block in content)
+        input_tokens, output_tokens = self._usage(messages, content)
+        return {"body": self._anthropic_events(modelId, text, input_tokens, output_tokens), "contentType": "application/json"}
+
+    def _anthropic_events(self, model_id, text, input_tokens, output_tokens):
+        events = [
+            {"type": "message_start", "message": {"role": "assistant", "model": model_id, "content": [], "usage": {"input_tokens": input_tokens, "output_tokens": 0}}},
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+        ]
+        for event in events:
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+        for chunk in self._chunks(text):
+            time.sleep(self.token_latency)
+            event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}}
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+        for event in [
+            {"type": "content_block_stop", "index": 0},
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": output_tokens}},
+            {"type": "message_stop"}
+        ]:
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
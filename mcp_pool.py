@@ -0,0 +1,323 @@
+"""Reusable pool of initialized MCP client sessions.
+
+Opening a connection and running the initialize() handshake costs more
+than most tool calls, so clients keep a few sessions open and share them
+across calls instead of connecting once per call.
+
+The MCP client itself takes about half a second to import, so it is only
+imported when the first connection is opened. Interactive scripts can call
+preload_client() to do that in the background while they wait for input.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from admission import retry_after
+from stage_timing import timed
+
+# NOTES_SERVER_URL points the example clients at another server
+DEFAULT_SERVER_URL = os.environ.get("NOTES_SERVER_URL", "http://localhost:8080/sse")
+
+# Times a tool call rejected by the server's admission control is retried
+MAX_REJECTED_RETRIES = 5
+
+# Tools that change nothing on the server, so a call whose connection failed
+# can be sent again. Replaying a write that had already committed would turn
+# its success into a spurious failure (a duplicate ID or a version conflict).
+READ_ONLY_TOOLS = frozenset({"ReadNote", "ReadNotes", "ListNotes", "SearchNotes", "ChangesSince"})
+
+_client = None
+_preloader = None
+
+
+def _mcp():
+    """Return the MCP client classes, importing them on first use."""
+    global _client
+    if _client is None:
+        if _preloader is not None and _preloader is not threading.current_thread():
+            # Importing the package from two threads at once can trip over its circular imports
+            _preloader.join()
+    if _client is None:
+        import mcp.types
+        from mcp.client.session import ClientSession
+        from mcp.client.sse import sse_client
+        from mcp.client.streamable_http import streamablehttp_client
+        from mcp.shared.exceptions import McpError
+        _client = SimpleNamespace(
+            types=mcp.types,
+            ClientSession=ClientSession,
+            sse_client=sse_client,
+            streamablehttp_client=streamablehttp_client,
+            McpError=McpError
+        )
+    return _client
+
+
+def preload_client():
+    """Start importing the MCP client on a background thread, if it isn't already imported."""
+    global _preloader
+    if _client is None and _preloader is None:
+        _preloader = threading.Thread(target=_mcp, name="mcp-preload", daemon=True)
+        _preloader.start()
+
+
+async def call_tool_admitted(session, name, arguments, retries=MAX_REJECTED_RETRIES):
+    """Call a tool, waiting out and retrying rejections by the server's admission control."""
+    with timed("tool_call"):
+        for attempt in range(retries + 1):
+            result = await session.call_tool(name, arguments)
+            text = getattr(result.content[0], "text", "") if result.content else ""
+            delay = retry_after(text)
+            if delay is None or attempt == retries:
+                return result
+            await asyncio.sleep(delay)
+
+
+async def read_resource_admitted(session, uri, retries=MAX_REJECTED_RETRIES):
+    """Read a resource, waiting out and retrying rejections by the server's admission control."""
+    McpError = _mcp().McpError
+    with timed("resource_read"):
+        for attempt in range(retries + 1):
+            try:
+                return await session.read_resource(uri)
+            except McpError as e:
+                delay = retry_after(e.error.message, anywhere=True)
+                if delay is None or attempt == retries:
+                    raise
+            await asyncio.sleep(delay)
+
+
+class _CountingStream:
+    """Write stream wrapper that counts the messages handed to the transport.
+
+    Tells a request that never left the client (safe to send again) apart
+    from one the server may have received.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sent = 0
+
+    async def send(self, message):
+        await self.stream.send(message)
+        self.sent += 1
+
+    async def __aenter__(self):
+        await self.stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self.stream.__aexit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class _PooledConnection:
+    """One transport connection and its ClientSession, owned by a background task.
+
+    The transport client's task group must be entered and exited by the same
+    task, so each connection lives in its own task and is closed by
+    signalling it.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.session = None
+        self.writes = None
+        self.last_used = time.monotonic()
+        self._closing = asyncio.Event()
+        self._task = None
+
+    @property
+    def alive(self):
+        return self.session is not None and not self._task.done()
+
+    async def open(self):
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        await ready
+
+    async def _run(self, ready):
+        try:
+            client = _mcp()
+            async with self.pool.connect() as (read_stream, write_stream, *_):
+                self.writes = _CountingStream(write_stream)
+                async with client.ClientSession(
+                    read_stream,
+                    self.writes,
+                    message_handler=self.pool.message_handler,
+                    client_info=client.types.Implementation(name=self.pool.client_name, version="1.0.0")
+                ) as session:
+                    await session.initialize()
+                    self.session = session
+                    ready.set_result(None)
+                    await self._closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self.session = None
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            await self._task
+
+
+class MCPSessionPool:
+    """Hands out initialized sessions to an MCP server, reconnecting as needed.
+
+    URLs ending in /sse use the SSE transport; any other URL (such as the
+    /mcp endpoint of a production server) uses streamable HTTP.
+
+    At most `max_sessions` sessions are checked out at once; further callers
+    wait for one to be returned. A session that has been idle for longer than
+    `health_check_interval` seconds is pinged before reuse, and a session
+    whose connection fails is discarded and replaced on the next checkout.
+    """
+
+    def __init__(self, url=DEFAULT_SERVER_URL, client_name="MCPClient", message_handler=None,
+                 max_sessions=4, health_check_interval=30.0, health_check_timeout=5.0):
+        self.url = url
+        self.client_name = client_name
+        self.message_handler = message_handler
+        self.max_sessions = max_sessions
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.handshakes = 0
+        self._idle = []
+        self._connections = set()
+        self._semaphore = asyncio.Semaphore(max_sessions)
+
+    def connect(self):
+        """Open the transport for a new connection, picked from the URL."""
+        if self.url.rstrip("/").endswith("/sse"):
+            return _mcp().sse_client(self.url)
+        return _mcp().streamablehttp_client(self.url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _healthy(self, connection):
+        if not connection.alive:
+            return False
+        if time.monotonic() - connection.last_used < self.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(connection.session.send_ping(), self.health_check_timeout)
+        except Exception:
+            return False
+        return True
+
+    async def _discard(self, connection):
+        self._connections.discard(connection)
+        await connection.close()
+
+    async def _checkout(self):
+        while self._idle:
+            connection = self._idle.pop()
+            if await self._healthy(connection):
+                return connection
+            await self._discard(connection)
+        connection = _PooledConnection(self)
+        with timed("mcp_connect"):
+            await connection.open()
+        self.handshakes += 1
+        self._connections.add(connection)
+        return connection
+
+    @asynccontextmanager
+    async def session(self):
+        """Check out an initialized ClientSession for the duration of the block."""
+        async with self._connection() as connection:
+            yield connection.session
+
+    @asynccontextmanager
+    async def _connection(self):
+        client = _mcp()
+        async with self._semaphore:
+            connection = await self._checkout()
+            try:
+                yield connection
+            except client.McpError as e:
+                if e.error.code == client.types.CONNECTION_CLOSED:
+                    await self._discard(connection)
+                else:
+                    # The server answered with an error, so the connection is fine
+                    self._checkin(connection)
+                raise
+            except BaseException:
+                await self._discard(connection)
+                raise
+            else:
+                self._checkin(connection)
+
+    def _checkin(self, connection):
+        connection.last_used = time.monotonic()
+        if connection.alive:
+            self._idle.append(connection)
+        else:
+            self._connections.discard(connection)
+
+    async def _with_retry(self, operation, retries, replay=True):
+        """Run `operation` on a pooled session, retrying connection failures on a fresh connection.
+
+        A dropped connection surfaces either as a transport error or as an
+        McpError with code CONNECTION_CLOSED; other McpErrors are answers from
+        the server and are raised as they are. Failures before any request
+        was written to the connection are always retried. Unless `replay` is
+        set, later ones are not, since the server may already have acted on
+        the request.
+        """
+        client = _mcp()
+        for attempt in range(retries + 1):
+            sent = False
+            try:
+                async with self._connection() as connection:
+                    written = connection.writes.sent
+                    try:
+                        return await operation(connection.session)
+                    finally:
+                        sent = connection.writes.sent > written
+            except Exception as e:
+                if isinstance(e, client.McpError) and e.error.code != client.types.CONNECTION_CLOSED:
+                    raise
+                if attempt == retries or (sent and not replay):
+                    raise
+
+    async def call_tool(self, name, arguments, retries=1, idempotent=None):
+        """Call a tool on a pooled session, reconnecting once if the connection fails.
+
+        A call that fails after it may have reached the server is only sent
+        again for tools in READ_ONLY_TOOLS, or when `idempotent` is true;
+        pass it for a write that is safe to repeat. Calls rejected by the
+        server's admission control are retried after the delay it suggests.
+        """
+        if idempotent is None:
+            idempotent = name in READ_ONLY_TOOLS
+        return await self._with_retry(
+            lambda session: call_tool_admitted(session, name, arguments), retries, replay=idempotent
+        )
+
+    async def read_resource(self, uri, retries=1):
+        """Read a resource on a pooled session, reconnecting once if the connection fails.
+
+        Reads rejected by the server's admission control are retried after
+        the delay it suggests.
+        """
+        return await self._with_retry(lambda session: read_resource_admitted(session, uri), retries)
+
+    async def close(self):
+        """Close every connection the pool has opened."""
+        connections = list(self._connections)
+        self._idle.clear()
+        self._connections.clear()
+        for connection in connections:
+            await connection.close()
@@ -0,0 +1,216 @@
+"""Client-side copy of the server's notes, kept fresh through the change log.
+
+Downloading notes for every question costs network and time no matter how
+little has changed. NoteCache keeps the bodies it has read and remembers
+where it is in the server's change log. Each sync asks ChangesSince for the
+writes made since then and drops the bodies of the notes they touched, so
+only new or changed notes cross the wire again. Nothing it holds grows with
+the number of notes on the server beyond the byte bound. Each body is kept
+with its version, so callers that know the versions they want (from
+SearchNotes) also refetch a body changed after the last sync.
+
+Note bodies live in an in-memory LRU bounded by size in bytes. If a path
+is given they are also kept in a SQLite file, together with the sync
+position, so the cache survives restarts. Bodies evicted from memory are
+then read back from disk instead of the server.
+"""
+import asyncio
+import json
+import sqlite3
+from collections import OrderedDict
+
+from mcp_pool import call_tool_admitted
+
+# Notes requested per ReadNotes / ChangesSince call (the server's maximum)
+FETCH_BATCH_SIZE = 1000
+
+
+class NoteCache:
+    """Byte-bounded LRU of note bodies, invalidated through the server's change log."""
+
+    def __init__(self, pool, max_bytes=64 * 1024 * 1024, path=None):
+        self.pool = pool
+        self.max_bytes = max_bytes
+        self.path = path
+        self.store_id = None
+        self.seq = None
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._bodies = OrderedDict()
+        # Bumped whenever synced changes may make bodies stale, so a fetch
+        # that overlapped a sync doesn't store what it read
+        self._generation = 0
+        self._sync_lock = asyncio.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path)
+            with self._db:
+                self._db.execute("CREATE TABLE IF NOT EXISTS notes (id TEXT PRIMARY KEY, content TEXT, version INTEGER)")
+                if "version" not in {row[1] for row in self._db.execute("PRAGMA table_info(notes)")}:
+                    # Bodies cached before versions were kept match no version, so they are read again
+                    self._db.execute("ALTER TABLE notes ADD COLUMN version INTEGER")
+                self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value NOT NULL)")
+            meta = dict(self._db.execute("SELECT key, value FROM meta"))
+            if "seq" in meta:
+                self.store_id = meta["store_id"]
+                self.seq = meta["seq"]
+
+    async def sync(self):
+        """Drop bodies the server has changed since the last sync, or all of them if it can't tell."""
+        async with self._sync_lock:
+            async with self.pool.session() as session:
+                if self.seq is not None:
+                    while True:
+                        page = await self._changes_since(session, self.seq)
+                        if page["reset"] or page["store_id"] != self.store_id:
+                            break
+                        self._apply_changes(page["changes"])
+                        self.seq = page["next"]
+                        self._save_position()
+                        if self.seq >= page["latest"]:
+                            return
+                await self._reset(session)
+
+    async def _changes_since(self, session, since, limit=FETCH_BATCH_SIZE):
+        result = await call_tool_admitted(session, "ChangesSince", {"since": since, "limit": limit})
+        return json.loads(result.content[0].text)
+
+    def _apply_changes(self, changes):
+        # Whatever the write was, the cached body is out of date
+        note_ids = list(dict.fromkeys(change["note_id"] for change in changes))
+        self._generation += 1
+        for note_id in note_ids:
+            self._forget_body(note_id)
+        if self._db is not None:
+            with self._db:
+                self._db.executemany("DELETE FROM notes WHERE id = ?", ((note_id,) for note_id in note_ids))
+
+    async def _reset(self, session):
+        # Bodies can't be trusted across a reset, since we don't know what
+        # changed; start again from the log's current position
+        page = await self._changes_since(session, 0, limit=1)
+        self._generation += 1
+        self._bodies.clear()
+        self.bytes = 0
+        self.store_id = page["store_id"]
+        self.seq = page["latest"]
+        if self._db is not None:
+            with self._db:
+                self._db.execute("DELETE FROM notes")
+        self._save_position()
+
+    def _save_position(self):
+        if self._db is not None:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    [("store_id", self.store_id), ("seq", self.seq)]
+                )
+
+    def _remember(self, note_id, content, version):
+        self._forget_body(note_id)
+        size = len(content.encode())
+        if size > self.max_bytes:
+            return
+        self._bodies[note_id] = (content, version)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (evicted, _) = self._bodies.popitem(last=False)
+            self.bytes -= len(evicted.encode())
+
+    def _forget_body(self, note_id):
+        entry = self._bodies.pop(note_id, None)
+        if entry is not None:
+            self.bytes -= len(entry[0].encode())
+
+    async def get_many(self, note_ids, versions=None):
+        """Return {note_id: content} for the given IDs, fetching uncached bodies from the server.
+
+        If `versions` maps note IDs to the versions wanted, cached bodies at
+        any other version are fetched again. IDs that don't exist on the
+        server are left out.
+        """
+        versions = versions or {}
+
+        def current(entry, note_id):
+            return entry is not None and (note_id not in versions or entry[1] == versions[note_id])
+
+        found = {}
+        missing = []
+        for note_id in note_ids:
+            entry = self._bodies.get(note_id)
+            if current(entry, note_id):
+                self._bodies.move_to_end(note_id)
+                self.hits += 1
+                found[note_id] = entry[0]
+            else:
+                missing.append(note_id)
+
+        if missing and self._db is not None:
+            on_disk = {
+                note_id: entry for note_id, entry in self._read_from_disk(missing).items() if current(entry, note_id)
+            }
+            for note_id, (content, version) in on_disk.items():
+                self._remember(note_id, content, version)
+                found[note_id] = content
+            self.hits += len(on_disk)
+            self.disk_hits += len(on_disk)
+            missing = [note_id for note_id in missing if note_id not in on_disk]
+
+        if missing:
+            self.misses += len(missing)
+            generation = self._generation
+            fetched = await self._fetch(missing)
+            found.update((note_id, content) for note_id, (content, _) in fetched.items())
+            if generation != self._generation:
+                return found
+            for note_id, (content, version) in fetched.items():
+                self._remember(note_id, content, version)
+            if self._db is not None:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO notes (id, content, version) VALUES (?, ?, ?)",
+                        ((note_id, content, version) for note_id, (content, version) in fetched.items())
+                    )
+        return found
+
+    def _read_from_disk(self, note_ids):
+        found = {}
+        for start in range(0, len(note_ids), 500):
+            chunk = note_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for note_id, content, version in self._db.execute(
+                f"SELECT id, content, version FROM notes WHERE id IN ({placeholders}) AND content IS NOT NULL", chunk
+            ):
+                found[note_id] = (content, version)
+        return found
+
+    async def _fetch(self, note_ids):
+        fetched = {}
+        async with self.pool.session() as session:
+            for start in range(0, len(note_ids), FETCH_BATCH_SIZE):
+                result = await call_tool_admitted(session, "ReadNotes", {"note_ids": note_ids[start:start + FETCH_BATCH_SIZE]})
+                for item in json.loads(result.content[0].text)["results"]:
+                    if item["status"] == "ok":
+                        fetched[item["note_id"]] = (item["content"], item["version"])
+        return fetched
+
+    def stats(self):
+        """Return hit/miss counters for note bodies and the cache size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._bodies),
+            "bytes": self.bytes,
+            "seq": self.seq
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,251 @@
+"""Bulk import and export of notes as NDJSON.
+
+Each line of the file is one note: {"note_id": "...", "content": "..."}.
+Files ending in .gz, .bz2 or .xz are (de)compressed on the fly, and "-"
+means stdin/stdout. Notes are streamed in batches, so memory use stays
+bounded by the batch size whatever the size of the file.
+
+By default the store is opened directly, configured by the same
+NOTES_STORE / NOTES_DB_PATH / NOTES_WAL_DIR settings as the server (or
+--store / --path). This is the fast path for loading a corpus. With --url
+the notes go through a running server's CreateNotes, ListNotes and
+ReadNotes tools instead.
+
+Examples:
+    NOTES_STORE=sqlite python notes_bulk.py import corpus.ndjson.gz
+    python notes_bulk.py export backup.ndjson.gz --prefix project-
+    python notes_bulk.py import corpus.ndjson --url http://localhost:8080/sse
+"""
+import argparse
+import asyncio
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import sys
+import time
+
+from notes_store import create_store
+
+# Each takes (binary file object, mode)
+COMPRESSORS = {
+    ".gz": lambda raw, mode: gzip.GzipFile(fileobj=raw, mode=mode),
+    ".bz2": bz2.BZ2File,
+    ".xz": lzma.LZMAFile
+}
+
+# The server's limit on notes per CreateNotes / ReadNotes / ListNotes call
+MCP_BATCH_SIZE = 1000
+
+
+def open_ndjson(path, mode):
+    """Open an NDJSON file as text, compressed according to its extension.
+
+    Returns (text_file, raw_file); the raw file's position tracks progress
+    through a compressed file.
+    """
+    if path == "-":
+        raw = sys.stdin.buffer if mode == "r" else sys.stdout.buffer
+    else:
+        raw = open(path, mode + "b")
+    compressor = COMPRESSORS.get(os.path.splitext(path)[1])
+    binary = compressor(raw, mode + "b") if compressor else raw
+    return io.TextIOWrapper(binary, encoding="utf-8", newline="\n"), raw
+
+
+class Progress:
+    """Prints a progress line to stderr at most every `interval` seconds."""
+
+    def __init__(self, verb, total_bytes=None, interval=2.0):
+        self.verb = verb
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last = self.started
+        self.done = 0
+        self.skipped = 0
+        self.invalid = 0
+
+    def update(self, position=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = now - self.started
+        line = f"{self.verb} {self.done} notes ({self.done / elapsed if elapsed else 0:.0f}/s)"
+        if self.skipped or self.invalid:
+            line += f", {self.skipped} skipped, {self.invalid} invalid"
+        if position is not None and self.total_bytes:
+            line += f", {100 * position / self.total_bytes:.1f}% of input"
+        print(line, file=sys.stderr, flush=True)
+
+    def summary(self):
+        return {
+            "notes": self.done,
+            "skipped": self.skipped,
+            "invalid": self.invalid,
+            "seconds": round(time.monotonic() - self.started, 3)
+        }
+
+
+def read_batches(text, batch_size, progress):
+    """Yield lists of (note_id, content) pairs parsed from NDJSON lines."""
+    batch = []
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            note_id, content = item["note_id"], item["content"]
+            if not isinstance(note_id, str) or not isinstance(content, str):
+                raise TypeError("note_id and content must be strings")
+        except (ValueError, KeyError, TypeError) as e:
+            progress.invalid += 1
+            if progress.invalid <= 10:
+                print(f"Line {line_number}: skipping invalid note ({e})", file=sys.stderr)
+            continue
+        batch.append((note_id, content))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_notes(text, notes):
+    for note_id, content in notes:
+        text.write(json.dumps({"note_id": note_id, "content": content}, ensure_ascii=False) + "\n")
+
+
+async def import_to_store(store, text, raw, batch_size, progress):
+    # Batches are parsed and written one after the other. Both are Python
+    # code holding the GIL, so parsing the next batch on another thread while
+    # the store writes measured no faster with any backend.
+    for batch in read_batches(text, batch_size, progress):
+        created = await store.create_many(batch)
+        progress.done += sum(created)
+        progress.skipped += len(batch) - sum(created)
+        progress.update(raw.tell() if raw.seekable() else None)
+
+
+async def export_from_store(store, text, batch_size, prefix, progress):
+    after = None
+    while True:
+        note_ids, has_more = await store.list_page(after=after, limit=batch_size, prefix=prefix)
+        contents = await store.get_many(note_ids)
+        # A note can't disappear between listing and reading today, but be safe
+        notes = [(note_id, contents[note_id]) for note_id in note_ids if contents[note_id] is not None]
+        write_notes(text, notes)
+        progress.done += len(notes)
+        progress.update()
+        if not has_more:
+            return
+        after = note_ids[-1]
+
+
+async def import_over_mcp(pool, text, raw, concurrency, progress):
+    # At most `concurrency` batches are in flight; reading waits for a free slot
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def send(batch):
+        try:
+            result = await pool.call_tool("CreateNotes", {"notes": [
+                {"note_id": note_id, "content": content} for note_id, content in batch
+            ]})
+        finally:
+            slots.release()
+        response = result.content[0].text
+        if response.startswith("Error"):
+            raise RuntimeError(f"CreateNotes failed: {response}")
+        failed = json.loads(response)["failed"]
+        progress.done += len(batch) - failed
+        progress.skipped += failed
+        progress.update(raw.tell() if raw.seekable() else None)
+
+    try:
+        for batch in read_batches(text, MCP_BATCH_SIZE, progress):
+            await slots.acquire()
+            for task in [task for task in pending if task.done()]:
+                pending.discard(task)
+                # Stop at the first failed batch
+                task.result()
+            pending.add(asyncio.create_task(send(batch)))
+        await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def export_over_mcp(pool, text, prefix, progress):
+    cursor = ""
+    while True:
+        result = await pool.call_tool("ListNotes", {"cursor": cursor, "limit": MCP_BATCH_SIZE, "prefix": prefix})
+        listing = json.loads(result.content[0].text)
+        if listing["note_ids"]:
+            result = await pool.call_tool("ReadNotes", {"note_ids": listing["note_ids"]})
+            notes = [
+                (item["note_id"], item["content"])
+                for item in json.loads(result.content[0].text)["results"]
+                if item["status"] == "ok"
+            ]
+            write_notes(text, notes)
+            progress.done += len(notes)
+            progress.update()
+        cursor = listing["next_cursor"]
+        if not cursor:
+            return
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Import or export notes as (compressed) NDJSON.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("file", help="NDJSON file (.gz, .bz2 or .xz to compress), or - for stdin/stdout")
+    parser.add_argument("--url", help="Go through the MCP server at this URL instead of opening the store")
+    parser.add_argument("--store", choices=["memory", "wal", "sqlite"], help="Storage backend (default: NOTES_STORE)")
+    parser.add_argument("--path", help="Database file or log directory (default: NOTES_DB_PATH / NOTES_WAL_DIR)")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Notes per store batch (direct mode)")
+    parser.add_argument("--concurrency", type=int, default=4, help="CreateNotes calls in flight (--url mode)")
+    parser.add_argument("--prefix", default="", help="Only export notes whose ID starts with this prefix")
+    args = parser.parse_args()
+
+    store = pool = None
+    if args.url:
+        from mcp_pool import MCPSessionPool
+        pool = MCPSessionPool(args.url, client_name="NotesBulk", max_sessions=args.concurrency)
+    else:
+        kind = args.store or os.environ.get("NOTES_STORE", "memory")
+        if kind == "memory":
+            parser.error("the memory store doesn't outlive this process; use --store sqlite/wal or --url")
+        store = create_store(kind, args.path)
+
+    text, raw = open_ndjson(args.file, "r" if args.command == "import" else "w")
+    total_bytes = os.path.getsize(args.file) if args.command == "import" and args.file != "-" else None
+    progress = Progress("Imported" if args.command == "import" else "Exported", total_bytes)
+    try:
+        if args.command == "import" and pool:
+            await import_over_mcp(pool, text, raw, args.concurrency, progress)
+        elif args.command == "import":
+            await import_to_store(store, text, raw, args.batch_size, progress)
+        elif pool:
+            await export_over_mcp(pool, text, args.prefix, progress)
+        else:
+            await export_from_store(store, text, args.batch_size, args.prefix, progress)
+    finally:
+        # Closing flushes compressed output; don't close the process's stdio
+        text.flush()
+        if args.file != "-":
+            text.close()
+            raw.close()
+        if pool is not None:
+            await pool.close()
+        if store is not None:
+            await store.close()
+    progress.update(force=True)
+    print(json.dumps(progress.summary()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,17 @@
 from mcp.server import FastMCP
-from mcp.types import ToolAnnotations
+from mcp.types import SubscribeRequest, ToolAnnotations
+from pydantic import AnyUrl
 import json
 import asyncio
+import base64
+import logging
+import os
+import weakref
+from admission import AdmissionController, Rejected, parse_costs
+from notes_store import CachedNoteStore, NoteLocks, SQLiteNoteStore, WALNoteStore, create_store, missing_changes
+from read_cache import create_read_cache
+from search_index import InvertedIndex
+from server_metrics import MIN_PROFILE_INTERVAL, SamplingProfiler, ServerMetrics, bind_metrics_port
 
 # This is our "database" (just a dictionary for this example)
 notes = {
@@ -10,25 +20,318 @@ notes = {
     "note3": "Finish project report"
 }
 
+# The storage backend is picked with NOTES_STORE ("memory", "wal" or
+# "sqlite"); the in-memory default keeps using the dictionary above
+backend = create_store(seed=notes)
+
+# Reads of hot notes are answered from memory by a read cache bounded by
+# NOTES_READ_CACHE_BYTES. NOTES_READ_CACHE picks the policy ("w-tinylfu",
+# "lru" or "none"); by default only SQLite, whose reads hit disk, gets one.
+# Other processes can write to a SQLite store, so the cache drops notes they
+# changed, checking the change log at most every NOTES_READ_CACHE_REFRESH
+# seconds.
+read_cache = create_read_cache(
+    os.environ.get("NOTES_READ_CACHE", "w-tinylfu" if isinstance(backend, SQLiteNoteStore) else "none"),
+    int(os.environ.get("NOTES_READ_CACHE_BYTES", str(64 * 1024 * 1024)))
+)
+store = CachedNoteStore(
+    backend, read_cache,
+    refresh_interval=float(os.environ.get("NOTES_READ_CACHE_REFRESH", "0.1")) if isinstance(backend, SQLiteNoteStore) else None
+) if read_cache is not None else backend
+
+# Held while a note is written and the search index updated to match, so
+# concurrent writes to one note reach the index in the order they were made
+note_locks = NoteLocks()
+
+# Full-text index over note contents, built on first search. A store only
+# this process writes to is kept indexed by the write handlers. A SQLite
+# store can also be written by other processes (production workers), so
+# there every write, ours included, is picked up from the store's change
+# log before each search instead.
+SHARED_STORE = isinstance(backend, SQLiteNoteStore)
+search_index = InvertedIndex()
+search_index_seq = None
+# Whether the write handlers keep the index up to date
+search_index_live = False
+search_index_lock = asyncio.Lock()
+
+async def index_notes(note_ids):
+    contents = await store.get_many(note_ids)
+    for note_id, content in contents.items():
+        if content is not None:
+            search_index.add(note_id, content)
+        else:
+            search_index.remove(note_id)
+
+def index_write(note_id, content=None):
+    """Index a note this process just wrote (content None: deleted).
+
+    Does nothing until the index is built, since building it reads every
+    note anyway, or when the writes are read from the change log.
+    """
+    if not search_index_live:
+        return
+    if content is None:
+        search_index.remove(note_id)
+    else:
+        search_index.add(note_id, content)
+
+async def build_search_index():
+    after = None
+    while True:
+        note_ids, has_more = await store.list_page(after=after, limit=1000)
+        await index_notes(note_ids)
+        if not has_more:
+            break
+        after = note_ids[-1]
+
+async def sync_search_index():
+    """Build the search index on first use, then apply other processes' writes made since."""
+    global search_index, search_index_seq, search_index_live
+    async with search_index_lock:
+        if not SHARED_STORE:
+            if not search_index_live:
+                # Writes made during the scan are indexed by their handlers.
+                # Reading a note and indexing it doesn't yield to them, so
+                # the scan can't put back an older body.
+                search_index_live = True
+                await build_search_index()
+            return
+        while True:
+            if search_index_seq is None:
+                # Note the log position first so writes made during the scan are replayed
+                _, latest = await store.changes_since(0, limit=0)
+                await build_search_index()
+                search_index_seq = latest
+            
+            changes, latest = await store.changes_since(search_index_seq, limit=1000)
+            if missing_changes(search_index_seq, changes, latest):
+                # Too far behind for the change log to catch us up: rebuild
+                search_index = InvertedIndex()
+                search_index_seq = None
+                continue
+            if not changes:
+                break
+            # Whatever the write was, the note's current content is what to index
+            await index_notes(list(dict.fromkeys(note_id for _, _, note_id in changes)))
+            search_index_seq = changes[-1][0]
+
+# NOTES_MODE=production turns off debug mode and verbose logging and serves
+# the stateless streamable-HTTP transport, so any worker can handle any request
+PRODUCTION = os.environ.get("NOTES_MODE", "development") == "production"
+
 # Create a FastMCP server instance with custom settings
 app = FastMCP(
     name="NotesServer",
     host="0.0.0.0",  # Listen on all interfaces
-    port=8080,
+    port=int(os.environ.get("NOTES_PORT", "8080")),
     # Set debug mode to get more information
-    debug=True,
+    debug=not PRODUCTION,
     # Set log level to DEBUG for more detailed logs
-    log_level="DEBUG"
+    log_level=os.environ.get("NOTES_LOG_LEVEL", "WARNING" if PRODUCTION else "DEBUG"),
+    stateless_http=PRODUCTION,
+    json_response=PRODUCTION
+)
+
+# Per-handler call counts and latencies, exported at /metrics, plus a
+# sampling profiler that is off until started through /debug/profile. That
+# endpoint lets anyone who can reach the port load the server, so it only
+# exists when NOTES_PROFILER=1.
+PROFILER_ENABLED = os.environ.get("NOTES_PROFILER", "") == "1"
+# With several production workers each one has its own metrics, so they are
+# scraped per worker on NOTES_METRICS_PORT and up rather than at /metrics
+WORKERS = int(os.environ.get("NOTES_WORKERS", "1"))
+METRICS_PORT = int(os.environ.get("NOTES_METRICS_PORT", "0")) or None
+metrics = ServerMetrics()
+metrics.gauge("notes_store_notes", "Number of notes in the store.", store.count)
+metrics.gauge("notes_search_index_documents", "Number of notes in the full-text index.", lambda: len(search_index))
+if isinstance(backend, WALNoteStore):
+    # Records per fsync shows how well group commit is batching writes
+    metrics.gauge("notes_wal_records", "Records appended to the write-ahead log since startup.", lambda: backend.log.records)
+    metrics.gauge("notes_wal_syncs", "fsyncs of the write-ahead log since startup.", lambda: backend.log.syncs)
+if read_cache is not None:
+    metrics.gauge(
+        "notes_read_cache_lookups", "Read cache lookups since startup, by policy and result.",
+        lambda: {(read_cache.policy, "hit"): read_cache.hits, (read_cache.policy, "miss"): read_cache.misses},
+        labelnames=["policy", "result"]
+    )
+    metrics.gauge(
+        "notes_read_cache_hit_ratio", "Fraction of read cache lookups that were hits, by policy.",
+        lambda: {(read_cache.policy,): read_cache.stats()["hit_rate"]}, labelnames=["policy"]
+    )
+    metrics.gauge("notes_read_cache_bytes", "Memory held by cached note contents.", lambda: read_cache.bytes)
+profiler = SamplingProfiler()
+
+def client_key():
+    """Identify the client making the current call: its MCP session, or its address when stateless."""
+    request = app.get_context().request_context.request
+    if request is None:
+        return "local"
+    session_id = request.query_params.get("session_id") or request.headers.get("mcp-session-id")
+    if session_id:
+        return session_id
+    return request.client.host if request.client else "unknown"
+
+# Relative cost of each tool and resource read against a client's rate
+# limit; calls that read or write many notes count for more. Override with
+# NOTES_TOOL_COSTS, e.g. "ListNotes=10,CreateNotes=50".
+TOOL_COSTS = {
+    "ReadNote": 1,
+    "CreateNote": 1,
+    "ListNotes": 5,
+    "SearchNotes": 5,
+    "ChangesSince": 5,
+    "UpdateNote": 1,
+    "DeleteNote": 1,
+    "ReadNotes": 10,
+    "CreateNotes": 20,
+    "resource://notes": 5,
+    "resource://notes/{cursor}": 5,
+    "resource://notes/version": 1,
+    **parse_costs(os.environ.get("NOTES_TOOL_COSTS", ""))
+}
+
+# Tool calls and resource reads are admitted by a token bucket per client (NOTES_RATE_LIMIT
+# cost units per second, bursts up to NOTES_RATE_BURST) and a global limit
+# of NOTES_MAX_IN_FLIGHT running calls, with up to NOTES_MAX_QUEUE more
+# waiting at most NOTES_QUEUE_TIMEOUT seconds. The rest are rejected with
+# a retry-after hint; a rejected resource read fails with the same message.
+# Rejected calls never reach the handlers' metrics. Limits apply per worker
+# process.
+admission = AdmissionController(
+    client_key,
+    rate=float(os.environ.get("NOTES_RATE_LIMIT", "200")),
+    burst=float(os.environ.get("NOTES_RATE_BURST", "0")) or None,
+    max_in_flight=int(os.environ.get("NOTES_MAX_IN_FLIGHT", "64")),
+    max_queue=int(os.environ.get("NOTES_MAX_QUEUE", "256")),
+    queue_timeout=float(os.environ.get("NOTES_QUEUE_TIMEOUT", "1.0")),
+    costs=TOOL_COSTS
 )
+metrics.gauge(
+    "notes_admission_rejections", "Tool calls and resource reads rejected by admission control since startup, by handler and reason.",
+    lambda: dict(admission.rejections), labelnames=["handler", "reason"]
+)
+def not_a_rejection(record):
+    """Logging filter that drops errors caused by an admission rejection."""
+    error = record.exc_info[1] if record.exc_info else None
+    while error is not None:
+        if isinstance(error, Rejected):
+            return False
+        error = error.__cause__ or error.__context__
+    return True
+
+# FastMCP logs a failed resource read with its traceback; a rejected one is
+# expected under load and already counted in notes_admission_rejections
+logging.getLogger("mcp.server.fastmcp.server").addFilter(not_a_rejection)
+
+metrics.gauge("notes_admission_queued", "Tool calls and resource reads waiting for a slot to run.", lambda: admission.queued)
+
+# Default and maximum number of note IDs returned per listing page
+LIST_PAGE_SIZE = 100
+MAX_LIST_PAGE_SIZE = 1000
+
+def encode_cursor(after: str, prefix: str) -> str:
+    """Pack the listing position into an opaque, URI-safe cursor."""
+    raw = json.dumps({"after": after, "prefix": prefix}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+# Sessions that asked (resources/subscribe) to hear about changes to a
+# resource, with the URIs they subscribed to. With the stateless transport
+# used in production a session ends with its request, so there notifications
+# only reach the session that made the write; use ChangesSince instead.
+subscriptions = weakref.WeakKeyDictionary()
+notify_pending = False
+
+# URIs whose content changes whenever a note is written
+CHANGED_URIS = {"resource://notes", "resource://notes/version"}
+
+# Writes within this many seconds of each other share one notification
+NOTIFY_DELAY = 0.1
+
+# FastMCP doesn't expose subscriptions, so register them on the low-level server
+@app._mcp_server.subscribe_resource()
+async def subscribe(uri):
+    subscriptions.setdefault(app.get_context().session, set()).add(str(uri))
+
+@app._mcp_server.unsubscribe_resource()
+async def unsubscribe(uri):
+    subscriptions.get(app.get_context().session, set()).discard(str(uri))
+
+# The low-level server always advertises resources.subscribe=False, so
+# clients following the spec would never subscribe; report the handlers
+# registered above instead
+_server_capabilities = app._mcp_server.get_capabilities
+
+def get_capabilities(*args, **kwargs):
+    capabilities = _server_capabilities(*args, **kwargs)
+    if capabilities.resources is not None and SubscribeRequest in app._mcp_server.request_handlers:
+        capabilities.resources.subscribe = True
+    return capabilities
+
+app._mcp_server.get_capabilities = get_capabilities
+
+def notify_notes_changed():
+    """Tell subscribed sessions that the notes changed, coalescing bursts of writes."""
+    global notify_pending
+    if subscriptions and not notify_pending:
+        notify_pending = True
+        asyncio.create_task(send_change_notifications())
 
-# Define resource handler
+async def send_change_notifications():
+    global notify_pending
+    await asyncio.sleep(NOTIFY_DELAY)
+    # Writes from here on schedule another round
+    notify_pending = False
+    for session, uris in list(subscriptions.items()):
+        try:
+            for uri in sorted(CHANGED_URIS & uris):
+                await session.send_resource_updated(AnyUrl(uri))
+        except Exception:
+            # The client has gone away
+            subscriptions.pop(session, None)
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Unpack a cursor produced by encode_cursor into (after, prefix)."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    position = json.loads(base64.urlsafe_b64decode(padded))
+    if not isinstance(position, dict) or not all(isinstance(position.get(key), str) for key in ("after", "prefix")):
+        raise ValueError("Invalid cursor")
+    return position["after"], position["prefix"]
+
+async def list_notes_page(after=None, limit=LIST_PAGE_SIZE, prefix="") -> str:
+    """Build one page of the note listing as JSON."""
+    limit = max(1, min(limit, MAX_LIST_PAGE_SIZE))
+    note_ids, has_more = await store.list_page(after=after, limit=limit, prefix=prefix)
+    return json.dumps({
+        "note_ids": note_ids,
+        "next_cursor": encode_cursor(note_ids[-1], prefix) if has_more else None
+    })
+
+# Define resource handlers
 @app.resource(uri="resource://notes", name="Notes", mime_type="application/json")
+@admission.limit("resource://notes", raise_rejections=True)
+@metrics.instrument("resource://notes")
 async def notes_resource() -> str:
-    """Get a list of all available notes."""
+    """Get the first page of available note IDs."""
+    return await list_notes_page()
+
+@app.resource(uri="resource://notes/version", name="NotesVersion", mime_type="application/json")
+@admission.limit("resource://notes/version", raise_rejections=True)
+@metrics.instrument("resource://notes/version")
+async def notes_version_resource() -> str:
+    """Get a version token that changes whenever a note is written."""
     return json.dumps({
-        "note_ids": list(notes.keys())
+        "version": await store.version()
     })
 
+@app.resource(uri="resource://notes/{cursor}", name="NotesPage", mime_type="application/json")
+@admission.limit("resource://notes/{cursor}", raise_rejections=True)
+@metrics.instrument("resource://notes/{cursor}")
+async def notes_page_resource(cursor: str) -> str:
+    """Get the page of note IDs following the given cursor."""
+    after, prefix = decode_cursor(cursor)
+    return await list_notes_page(after=after, prefix=prefix)
+
 # Define tool handlers
 @app.tool(
     name="ReadNote",
@@ -43,10 +346,13 @@ async def notes_resource() -> str:
         }
     )
 )
+@admission.limit("ReadNote")
+@metrics.instrument("ReadNote")
 async def read_note(note_id: str) -> str:
     """Read a specific note by its ID."""
-    if note_id in notes:
-        return notes[note_id]
+    content = await store.get(note_id)
+    if content is not None:
+        return content
     else:
         return "Note not found"
 
@@ -64,14 +370,289 @@ async def read_note(note_id: str) -> str:
         }
     )
 )
+@admission.limit("CreateNote")
+@metrics.instrument("CreateNote")
 async def create_note(note_id: str, content: str) -> str:
     """Create a new note with the given ID and content."""
-    if note_id in notes:
-        return "Error: This note ID already exists"
+    async with note_locks.hold(note_id):
+        if not await store.create(note_id, content):
+            return "Error: This note ID already exists"
+        index_write(note_id, content)
     
-    notes[note_id] = content
+    notify_notes_changed()
     return f"Note {note_id} created successfully"
 
+def write_result(note_id, done, status, version, expected_version):
+    """Describe the outcome of a compare-and-set write for the caller."""
+    if status == "not_found":
+        return "Error: Note not found"
+    if status == "conflict":
+        return (
+            f"Error: Version conflict: note {note_id} is at version {version}, not {expected_version}. "
+            "Read it again and retry."
+        )
+    if version is None:
+        return f"Note {note_id} {done} successfully"
+    return f"Note {note_id} {done} successfully (version {version})"
+
+@app.tool(
+    name="UpdateNote",
+    description="Replace a note's content, only if it hasn't changed since you read it.",
+    annotations=ToolAnnotations(
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "note_id": {"type": "string", "description": "The ID of the note to update"},
+                "content": {"type": "string", "description": "The new content of the note"},
+                "expected_version": {"type": "integer", "description": "The note's version when you read it (from ReadNotes)"}
+            },
+            "required": ["note_id", "content", "expected_version"]
+        }
+    )
+)
+@admission.limit("UpdateNote")
+@metrics.instrument("UpdateNote")
+async def update_note(note_id: str, content: str, expected_version: int) -> str:
+    """Replace a note's content if it is still at `expected_version`."""
+    async with note_locks.hold(note_id):
+        status, version = await store.update(note_id, content, expected_version)
+        if status == "updated":
+            index_write(note_id, content)
+            notify_notes_changed()
+    return write_result(note_id, "updated", status, version, expected_version)
+
+@app.tool(
+    name="DeleteNote",
+    description="Delete a note, only if it hasn't changed since you read it.",
+    annotations=ToolAnnotations(
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "note_id": {"type": "string", "description": "The ID of the note to delete"},
+                "expected_version": {"type": "integer", "description": "The note's version when you read it (from ReadNotes)"}
+            },
+            "required": ["note_id", "expected_version"]
+        }
+    )
+)
+@admission.limit("DeleteNote")
+@metrics.instrument("DeleteNote")
+async def delete_note(note_id: str, expected_version: int) -> str:
+    """Delete a note if it is still at `expected_version`."""
+    async with note_locks.hold(note_id):
+        status, version = await store.delete(note_id, expected_version)
+        if status == "deleted":
+            index_write(note_id)
+            notify_notes_changed()
+    return write_result(note_id, "deleted", status, version, expected_version)
+
+@app.tool(
+    name="ListNotes",
+    description="List note IDs in sorted order, one page at a time, optionally filtered by prefix.",
+    annotations=ToolAnnotations(
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "cursor": {"type": "string", "description": "The next_cursor of the previous page"},
+                "limit": {"type": "integer", "description": "The maximum number of IDs to return"},
+                "prefix": {"type": "string", "description": "Only list IDs starting with this prefix"}
+            }
+        }
+    )
+)
+@admission.limit("ListNotes")
+@metrics.instrument("ListNotes")
+async def list_notes(cursor: str = "", limit: int = LIST_PAGE_SIZE, prefix: str = "") -> str:
+    """List note IDs one page at a time, optionally filtered by prefix."""
+    after = None
+    if cursor:
+        try:
+            after, prefix = decode_cursor(cursor)
+        except ValueError:
+            return "Error: Invalid cursor"
+    return await list_notes_page(after=after, limit=limit, prefix=prefix)
+
+# Upper bound on the number of notes a single batch call may touch
+MAX_BATCH_SIZE = 1000
+
+@app.tool(
+    name="ReadNotes",
+    description="Read several notes by their IDs in a single call, with the version of each note.",
+    annotations=ToolAnnotations(
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "note_ids": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "The IDs of the notes to read"
+                }
+            },
+            "required": ["note_ids"]
+        }
+    )
+)
+@admission.limit("ReadNotes")
+@metrics.instrument("ReadNotes")
+async def read_notes(note_ids: list[str]) -> str:
+    """Read several notes by their IDs, reporting missing notes per item."""
+    if len(note_ids) > MAX_BATCH_SIZE:
+        return f"Error: At most {MAX_BATCH_SIZE} notes can be read per call"
+    
+    entries = await store.get_many_versioned(note_ids)
+    results = []
+    for note_id in note_ids:
+        entry = entries[note_id]
+        if entry is not None:
+            content, version = entry
+            results.append({"note_id": note_id, "status": "ok", "content": content, "version": version})
+        else:
+            results.append({"note_id": note_id, "status": "error", "error": "Note not found"})
+    
+    return json.dumps({
+        "results": results,
+        "failed": sum(1 for result in results if result["status"] == "error")
+    })
+
+@app.tool(
+    name="CreateNotes",
+    description="Create several notes in a single call.",
+    annotations=ToolAnnotations(
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "notes": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "note_id": {"type": "string"},
+                            "content": {"type": "string"}
+                        },
+                        "required": ["note_id", "content"]
+                    },
+                    "description": "The notes to create"
+                }
+            },
+            "required": ["notes"]
+        }
+    )
+)
+@admission.limit("CreateNotes")
+@metrics.instrument("CreateNotes")
+async def create_notes(notes: list[dict]) -> str:
+    """Create several notes, reporting success or failure per item."""
+    if len(notes) > MAX_BATCH_SIZE:
+        return f"Error: At most {MAX_BATCH_SIZE} notes can be created per call"
+    
+    # Reject malformed items up front and only send valid ones to the store
+    results = [None] * len(notes)
+    valid = []
+    for index, item in enumerate(notes):
+        note_id = item.get("note_id") if isinstance(item, dict) else None
+        content = item.get("content") if isinstance(item, dict) else None
+        if not isinstance(note_id, str) or not isinstance(content, str):
+            results[index] = {"note_id": note_id, "status": "error", "error": "Each note needs a string note_id and content"}
+        else:
+            valid.append((index, note_id, content))
+    
+    async with note_locks.hold_many(note_id for _, note_id, _ in valid):
+        created = await store.create_many([(note_id, content) for _, note_id, content in valid])
+        for (index, note_id, content), ok in zip(valid, created):
+            if ok:
+                index_write(note_id, content)
+                results[index] = {"note_id": note_id, "status": "created"}
+            else:
+                results[index] = {"note_id": note_id, "status": "error", "error": "This note ID already exists"}
+    if any(created):
+        notify_notes_changed()
+    
+    return json.dumps({
+        "results": results,
+        "failed": sum(1 for result in results if result["status"] == "error")
+    })
+
+@app.tool(
+    name="SearchNotes",
+    description="Find the notes that best match a text query, ranked by relevance.",
+    annotations=ToolAnnotations(
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "The words to search for"},
+                "limit": {"type": "integer", "description": "The maximum number of notes to return"},
+                "include_content": {
+                    "type": "boolean",
+                    "description": "Return each note's content (default); false returns only IDs, scores and versions"
+                }
+            },
+            "required": ["query"]
+        }
+    )
+)
+@admission.limit("SearchNotes")
+@metrics.instrument("SearchNotes")
+async def search_notes(query: str, limit: int = 10, include_content: bool = True) -> str:
+    """Find the notes that best match a text query, ranked by BM25 score.
+
+    Every result carries the note's version. Clients that keep their own
+    copy of the notes pass include_content=False and read only the bodies
+    they don't have at that version.
+    """
+    await sync_search_index()
+    matches = search_index.search(query, limit=max(1, min(limit, MAX_BATCH_SIZE)))
+    entries = await store.get_many_versioned([note_id for note_id, _ in matches])
+    results = []
+    for note_id, score in matches:
+        if entries[note_id] is None:
+            continue
+        content, version = entries[note_id]
+        result = {"note_id": note_id, "score": round(score, 4), "version": version}
+        if include_content:
+            result["content"] = content
+        results.append(result)
+    return json.dumps({"results": results})
+
+# Default and maximum number of changes returned by one ChangesSince call
+CHANGES_PAGE_SIZE = 1000
+MAX_CHANGES_PAGE_SIZE = 10000
+
+@app.tool(
+    name="ChangesSince",
+    description="List the note writes made after a change sequence number, to sync a copy of the notes incrementally.",
+    annotations=ToolAnnotations(
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "since": {"type": "integer", "description": "The next (or latest) value returned by an earlier call"},
+                "limit": {"type": "integer", "description": "The maximum number of changes to return"}
+            }
+        }
+    )
+)
+@admission.limit("ChangesSince")
+@metrics.instrument("ChangesSince")
+async def changes_since(since: int = 0, limit: int = CHANGES_PAGE_SIZE) -> str:
+    """List the note writes made after sequence number `since`, oldest first.
+
+    A new copy of the notes starts by noting `latest`, then reads every
+    note and syncs from there. Pass the returned `next` as `since` to
+    continue. `reset` is true when
+    the change log no longer covers `since` (it has been trimmed, or comes
+    from another store, see `store_id`): the caller should then re-read
+    every note and continue from `latest`.
+    """
+    limit = max(1, min(limit, MAX_CHANGES_PAGE_SIZE))
+    changes, latest = await store.changes_since(since, limit=limit)
+    reset = missing_changes(since, changes, latest)
+    return json.dumps({
+        "changes": [] if reset else [{"seq": seq, "op": op, "note_id": note_id} for seq, op, note_id in changes],
+        "next": changes[-1][0] if changes and not reset else since,
+        "latest": latest,
+        "reset": reset,
+        "store_id": store.store_id
+    })
+
 # Add a simple root handler for debugging
 @app.custom_route("/", methods=["GET"])
 async def root(request):
@@ -80,12 +661,119 @@ async def root(request):
         "status": "ok",
         "message": "Notes MCP Server is running",
         "endpoints": {
-            "sse": "/sse"
+            "sse": "/sse",
+            "metrics": "/metrics",
+            **({"profile": "/debug/profile"} if PROFILER_ENABLED else {})
         }
     })
 
+@app.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request):
+    from starlette.responses import PlainTextResponse
+    if WORKERS > 1:
+        # Whichever worker took the connection would answer with its own
+        # counters, so successive scrapes wouldn't add up
+        where = f"ports {METRICS_PORT}-{METRICS_PORT + WORKERS - 1}" if METRICS_PORT else "their own ports (start the server with --metrics-port)"
+        return PlainTextResponse(
+            f"Metrics are per worker with {WORKERS} workers; scrape each worker on {where}\n", status_code=503
+        )
+    return PlainTextResponse(await metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# GET returns the collected stacks; POST with ?action=start (and optionally
+# &interval=seconds) or ?action=stop toggles sampling without a restart
+async def profile_endpoint(request):
+    from starlette.responses import JSONResponse, PlainTextResponse
+    if request.method == "GET":
+        limit = request.query_params.get("limit")
+        try:
+            limit = int(limit) if limit else None
+        except ValueError:
+            limit = 0
+        if limit is not None and limit < 1:
+            return JSONResponse({"error": "limit must be a positive integer"}, status_code=400)
+        return PlainTextResponse(profiler.collapsed(limit))
+    
+    action = request.query_params.get("action")
+    if action == "start":
+        try:
+            profiler.start(interval=float(request.query_params.get("interval", "0.01")))
+        except ValueError:
+            return JSONResponse(
+                {"error": f"interval must be a number of seconds, at least {MIN_PROFILE_INTERVAL}"}, status_code=400
+            )
+    elif action == "stop":
+        profiler.stop()
+    else:
+        return JSONResponse({"error": "action must be start or stop"}, status_code=400)
+    return JSONResponse(profiler.status())
+
+if PROFILER_ENABLED:
+    app.custom_route("/debug/profile", methods=["GET", "POST"])(profile_endpoint)
+
+def create_asgi_app(transport):
+    """Build the ASGI app for a transport, counting open client connections."""
+    if transport == "sse":
+        return metrics.count_sessions(app.sse_app(), app.settings.sse_path)
+    return metrics.count_sessions(app.streamable_http_app(), app.settings.streamable_http_path)
+
+def production_app():
+    """ASGI app factory that uvicorn calls in each production worker."""
+    asgi_app = create_asgi_app(os.environ.get("NOTES_TRANSPORT", "streamable-http"))
+    if METRICS_PORT:
+        sock = bind_metrics_port(app.settings.host, range(METRICS_PORT, METRICS_PORT + WORKERS))
+        asgi_app = metrics.serve_scrapes(asgi_app, sock)
+    return asgi_app
+
 # Start the server
 if __name__ == "__main__":
-    print("Starting Notes MCP server on port 8080...")
-    # Use SSE transport instead of streamable-http
-    app.run(transport="sse")
+    import argparse
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description="Run the Notes MCP server.")
+    parser.add_argument("--production", action="store_true",
+                        help="Quiet logging, no debug mode and the streamable-HTTP transport")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (production mode only)")
+    parser.add_argument("--transport", choices=["sse", "streamable-http"],
+                        help="Transport to serve (default: sse, or streamable-http in production)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve each worker's /metrics on its own port, from this one up (production mode only)")
+    args = parser.parse_args()
+    
+    if args.production or PRODUCTION:
+        # Workers share nothing but the store, so it must live outside the process
+        if args.workers > 1 and not isinstance(backend, SQLiteNoteStore):
+            parser.error("--workers > 1 needs a store shared between processes (NOTES_STORE=sqlite)")
+        transport = args.transport or "streamable-http"
+        path = app.settings.sse_path if transport == "sse" else app.settings.streamable_http_path
+        print(f"Starting Notes MCP server ({transport} at {path}) on port {app.settings.port} with {args.workers} workers...")
+        # The workers import this module afresh and open their own store, so
+        # release this one (and pass the settings through the environment)
+        asyncio.run(store.close())
+        os.environ["NOTES_MODE"] = "production"
+        os.environ["NOTES_TRANSPORT"] = transport
+        os.environ["NOTES_WORKERS"] = str(args.workers)
+        if args.metrics_port:
+            os.environ["NOTES_METRICS_PORT"] = str(args.metrics_port)
+        uvicorn.run(
+            "notes_server:production_app",
+            factory=True,
+            workers=args.workers,
+            host=app.settings.host,
+            port=app.settings.port,
+            log_level=os.environ.get("NOTES_LOG_LEVEL", "WARNING").lower(),
+            access_log=False
+        )
+    else:
+        if args.workers > 1:
+            parser.error("--workers needs --production")
+        if args.metrics_port:
+            parser.error("--metrics-port needs --production")
+        print(f"Starting Notes MCP server on port {app.settings.port}...")
+        # Use SSE transport instead of streamable-http, counting open SSE streams
+        uvicorn.run(
+            create_asgi_app(args.transport or "sse"),
+            host=app.settings.host,
+            port=app.settings.port,
+            log_level=app.settings.log_level.lower()
+        )
@@ -0,0 +1,806 @@
+"""Storage backends for the Notes MCP server.
+
+Every backend exposes the same async interface so the tool handlers in
+notes_server.py never block the event loop, whichever engine is in use.
+
+Every note has a version: the sequence number, in the store's change log,
+of the write that last changed it (0 for notes the store was seeded with).
+Versions only grow and are never reused, even when a note is deleted and
+created again. update() and delete() take the version the caller last saw
+and refuse to overwrite a newer write (compare-and-set).
+"""
+import asyncio
+import bisect
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+
+from compact_notes import CompactNotes
+from write_ahead_log import WriteAheadLog
+
+# Number of most recent writes kept in each store's change log
+CHANGE_LOG_RETENTION = 100_000
+
+
+def _cas_failure(version, expected_version):
+    """Return the (status, version) result of a compare-and-set that can't go ahead, or None.
+
+    `version` is the note's current version, or None if it doesn't exist.
+    An `expected_version` of None matches any version.
+    """
+    if version is None:
+        return "not_found", None
+    if expected_version is not None and expected_version != version:
+        return "conflict", version
+    return None
+
+
+class SortedIDs:
+    """Note IDs kept in sorted order, with inserts and deletes that stay cheap as the set grows.
+
+    A single sorted list costs O(n) per insert (about half a millisecond at
+    2M notes). This keeps the IDs in sorted chunks of at most twice
+    `chunk_size`, found by bisecting the chunks' last IDs, so an insert or
+    delete moves at most one chunk and one slot of the chunk index.
+    """
+
+    def __init__(self, note_ids=(), chunk_size=1000):
+        self.chunk_size = chunk_size
+        ordered = sorted(note_ids)
+        self._chunks = [ordered[start:start + chunk_size] for start in range(0, len(ordered), chunk_size)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+
+    def add(self, note_id):
+        if not self._chunks:
+            self._chunks.append([note_id])
+            self._maxes.append(note_id)
+            return
+        index = min(bisect.bisect_left(self._maxes, note_id), len(self._maxes) - 1)
+        chunk = self._chunks[index]
+        bisect.insort(chunk, note_id)
+        self._maxes[index] = chunk[-1]
+        if len(chunk) > 2 * self.chunk_size:
+            tail = chunk[self.chunk_size:]
+            del chunk[self.chunk_size:]
+            self._maxes[index] = chunk[-1]
+            self._chunks.insert(index + 1, tail)
+            self._maxes.insert(index + 1, tail[-1])
+
+    def remove(self, note_id):
+        index = bisect.bisect_left(self._maxes, note_id)
+        chunk = self._chunks[index]
+        del chunk[bisect.bisect_left(chunk, note_id)]
+        if chunk:
+            self._maxes[index] = chunk[-1]
+        else:
+            del self._chunks[index]
+            del self._maxes[index]
+
+    def iter_from(self, start, inclusive=True):
+        """Yield the IDs from `start` (or just after it) on, in order."""
+        find = bisect.bisect_left if inclusive else bisect.bisect_right
+        index = find(self._maxes, start)
+        if index == len(self._chunks):
+            return
+        chunk = self._chunks[index]
+        yield from chunk[find(chunk, start):]
+        for chunk in self._chunks[index + 1:]:
+            yield from chunk
+
+
+def missing_changes(seq, changes, latest):
+    """Tell whether a changes_since(seq) result skipped writes the log no longer holds.
+
+    That happens when `seq` is older than the log's retention, or comes from
+    a different store (see `store_id`). The caller has to re-read every note
+    instead of applying the changes.
+    """
+    if changes:
+        return changes[0][0] != seq + 1
+    return latest != seq
+
+
+class MemoryNoteStore:
+    """Keeps every note in a plain dictionary (the default backend).
+
+    `notes` may be any mutable mapping, such as CompactNotes.
+    """
+
+    def __init__(self, notes=None, change_retention=CHANGE_LOG_RETENTION, versions=None, seq=0):
+        self.notes = notes if notes is not None else {}
+        # Version of every note written since seeding; the rest are at 0
+        self._versions = versions if versions is not None else {}
+        # Sorted copy of the keys so listings can page through IDs in order
+        self._sorted_ids = SortedIDs(self.notes)
+        # Identifies this store's versions and change log; the random ID keeps
+        # those from a previous run from being mistaken for current ones
+        self.store_id = uuid.uuid4().hex
+        self._version = 0
+        # Change log: entry N records the write with sequence number
+        # _changes_start + N + 1. Old entries are dropped in bulk once the
+        # log holds twice the retention.
+        self.change_retention = change_retention
+        self._changes = []
+        self._changes_start = seq
+
+    async def get(self, note_id):
+        """Return the content of a note, or None if it does not exist."""
+        return self.notes.get(note_id)
+
+    def _apply(self, op, note_id, content=None):
+        """Apply a create, update or delete and return its sequence number.
+
+        Callers check first that the write is allowed. Nothing here awaits,
+        so the check and the write happen atomically on the event loop.
+        """
+        seq = self._changes_start + len(self._changes) + 1
+        if op == "delete":
+            del self.notes[note_id]
+            self._versions.pop(note_id, None)
+            self._sorted_ids.remove(note_id)
+        else:
+            if op == "create":
+                self._sorted_ids.add(note_id)
+            self.notes[note_id] = content
+            self._versions[note_id] = seq
+        self._version += 1
+        self._changes.append((op, note_id))
+        if len(self._changes) > 2 * self.change_retention:
+            dropped = len(self._changes) - self.change_retention
+            del self._changes[:dropped]
+            self._changes_start += dropped
+        return seq
+
+    def _current_version(self, note_id):
+        if note_id not in self.notes:
+            return None
+        return self._versions.get(note_id, 0)
+
+    async def create(self, note_id, content):
+        """Insert a new note. Returns False if the ID is already taken."""
+        if note_id in self.notes:
+            return False
+        self._apply("create", note_id, content)
+        return True
+
+    async def update(self, note_id, content, expected_version=None):
+        """Replace a note's content if it is still at `expected_version` (None: any version).
+
+        Returns ("updated", new version), ("conflict", current version) or
+        ("not_found", None).
+        """
+        failure = _cas_failure(self._current_version(note_id), expected_version)
+        if failure:
+            return failure
+        return "updated", self._apply("update", note_id, content)
+
+    async def delete(self, note_id, expected_version=None):
+        """Delete a note if it is still at `expected_version` (None: any version).
+
+        Returns ("deleted", None), ("conflict", current version) or
+        ("not_found", None).
+        """
+        failure = _cas_failure(self._current_version(note_id), expected_version)
+        if failure:
+            return failure
+        self._apply("delete", note_id)
+        return "deleted", None
+
+    async def get_many(self, note_ids):
+        """Return a dict mapping each requested ID to its content or None."""
+        return {note_id: self.notes.get(note_id) for note_id in note_ids}
+
+    async def get_many_versioned(self, note_ids):
+        """Return a dict mapping each requested ID to its (content, version), or None."""
+        return {
+            note_id: (self.notes[note_id], self._versions.get(note_id, 0)) if note_id in self.notes else None
+            for note_id in note_ids
+        }
+
+    async def create_many(self, items):
+        """Insert (note_id, content) pairs in order, returning one bool per item."""
+        results = []
+        for note_id, content in items:
+            results.append(await self.create(note_id, content))
+        return results
+
+    async def list_page(self, after=None, limit=100, prefix=""):
+        """Return up to `limit` IDs sorted after `after` and starting with `prefix`.
+
+        The result is a (note_ids, has_more) tuple.
+        """
+        if after is not None and after >= prefix:
+            note_ids = self._sorted_ids.iter_from(after, inclusive=False)
+        else:
+            note_ids = self._sorted_ids.iter_from(prefix)
+        page = []
+        for note_id in itertools.islice(note_ids, limit + 1):
+            if not note_id.startswith(prefix):
+                break
+            page.append(note_id)
+        return page[:limit], len(page) > limit
+
+    async def count(self):
+        """Return the number of stored notes."""
+        return len(self.notes)
+
+    async def version(self):
+        """Return an opaque token that changes every time a note is written."""
+        return f"{self.store_id}-{self._version}"
+
+    async def changes_since(self, seq, limit=1000):
+        """Return up to `limit` (seq, op, note_id) writes after `seq`, and the latest seq.
+
+        If the log no longer reaches back to `seq`, the changes start at the
+        oldest write it still holds (see missing_changes).
+        """
+        start = max(seq, self._changes_start)
+        index = start - self._changes_start
+        changes = [
+            (start + offset + 1, op, note_id)
+            for offset, (op, note_id) in enumerate(self._changes[index:index + limit])
+        ]
+        return changes, self._changes_start + len(self._changes)
+
+    async def close(self):
+        pass
+
+
+class WALNoteStore(MemoryNoteStore):
+    """Keeps notes in memory and makes every write durable in a write-ahead log.
+
+    Reads are served from memory like MemoryNoteStore. Each write is
+    appended to the log and applied in memory straight away, so later
+    writes see it, but it is only acknowledged once the log says it is
+    durable. On startup the notes are rebuilt from the latest snapshot plus
+    the log written since. See write_ahead_log.py for the durability levels.
+
+    The change log is numbered like the write-ahead log, so a note's version
+    is the sequence number of its record and survives restarts.
+    """
+
+    def __init__(self, directory, seed=None, durability="batched", snapshot_every=100_000, compact=False):
+        self.log = WriteAheadLog(directory, durability=durability, snapshot_every=snapshot_every)
+        notes, versions = self.log.recover(seed)
+        super().__init__(CompactNotes(notes) if compact else notes, versions=versions, seq=self.log.last_seq)
+
+    async def create(self, note_id, content):
+        """Insert a new note. Returns False if the ID is already taken."""
+        if note_id in self.notes:
+            return False
+        await self._committed(self._write("create", note_id, content))
+        return True
+
+    async def create_many(self, items):
+        """Insert (note_id, content) pairs in order, returning one bool per item.
+
+        The whole batch is made durable together.
+        """
+        results = []
+        seq = None
+        for note_id, content in items:
+            if note_id in self.notes:
+                results.append(False)
+                continue
+            seq = self._write("create", note_id, content)
+            results.append(True)
+        if seq is not None:
+            await self._committed(seq)
+        return results
+
+    async def update(self, note_id, content, expected_version=None):
+        """Replace a note's content if it is still at `expected_version` (None: any version).
+
+        Returns ("updated", new version), ("conflict", current version) or
+        ("not_found", None).
+        """
+        failure = _cas_failure(self._current_version(note_id), expected_version)
+        if failure:
+            return failure
+        seq = self._write("update", note_id, content)
+        await self._committed(seq)
+        return "updated", seq
+
+    async def delete(self, note_id, expected_version=None):
+        """Delete a note if it is still at `expected_version` (None: any version).
+
+        Returns ("deleted", None), ("conflict", current version) or
+        ("not_found", None).
+        """
+        failure = _cas_failure(self._current_version(note_id), expected_version)
+        if failure:
+            return failure
+        await self._committed(self._write("delete", note_id))
+        return "deleted", None
+
+    def _write(self, op, note_id, content=None):
+        # Log and apply without awaiting in between, so records stay in the
+        # order the writes were applied and both sides number them alike
+        self.log.append(op, note_id, content)
+        return self._apply(op, note_id, content)
+
+    def _state(self):
+        return self.notes.copy(), dict(self._versions)
+
+    async def _committed(self, seq):
+        if self.log.snapshot_due():
+            self.log.start_snapshot(self._state)
+        await self.log.commit(seq)
+
+    async def close(self):
+        await self.log.close(self._state)
+
+
+class SQLiteNoteStore:
+    """Keeps notes in an on-disk SQLite database running in WAL mode.
+
+    Lookups go through the primary key B-tree, so reads stay O(log n) by ID
+    and opening the store never loads note bodies into memory. All SQLite
+    calls run on worker threads: a single writer thread owns the write
+    connection, while reads fan out over a small pool of reader connections
+    that WAL mode lets run alongside the writer. Each write transaction
+    takes SQLite's write lock before checking anything, so compare-and-set
+    stays atomic even with other processes writing to the same file.
+    """
+
+    def __init__(self, path, seed=None, readers=4, change_retention=CHANGE_LOG_RETENTION):
+        self.path = path
+        self.change_retention = change_retention
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notes-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="notes-reader")
+        # Create the schema synchronously so the store is usable right away
+        self.store_id = self._writer.submit(self._init_schema, seed).result()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Other processes (e.g. server workers) may hold the write lock briefly
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _init_schema(self, seed):
+        conn = self._connect()
+        # Take the write lock first so processes opening the same new
+        # database at once don't both create and seed it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes'"
+            ).fetchone()
+            if not exists:
+                conn.execute("CREATE TABLE notes (id TEXT PRIMARY KEY, content TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0)")
+                # Only seed a freshly created database, never an existing one
+                if seed:
+                    conn.executemany("INSERT INTO notes (id, content) VALUES (?, ?)", seed.items())
+            elif "version" not in {row[1] for row in conn.execute("PRAGMA table_info(notes)")}:
+                # Databases from before per-note versions start every note at 0
+                conn.execute("ALTER TABLE notes ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            # The note count is kept here so count() doesn't scan the table
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('count', (SELECT COUNT(*) FROM notes))")
+            # Every write is also appended here, so other processes sharing the
+            # database can find out what changed since they last looked
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, note_id TEXT NOT NULL)"
+            )
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        return conn.execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()[0]
+
+    def _log_change(self, conn, op, note_id):
+        """Append a write to the change log and return its sequence number."""
+        seq = conn.execute("INSERT INTO changes (op, note_id) VALUES (?, ?)", (op, note_id)).lastrowid
+        # Trim the log now and then rather than on every write
+        if seq % 1000 == 0:
+            conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - self.change_retention,))
+        return seq
+
+    @contextmanager
+    def _write_transaction(self):
+        conn = self._connect()
+        # Take the write lock up front so nothing changes between our checks and writes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _bump_version(self, conn, added):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        conn.execute("UPDATE meta SET value = value + ? WHERE key = 'count'", (added,))
+
+    async def _run(self, executor, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, fn, *args)
+
+    def _get(self, note_id):
+        row = self._connect().execute(
+            "SELECT content FROM notes WHERE id = ?", (note_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _current_version(self, conn, note_id):
+        row = conn.execute("SELECT version FROM notes WHERE id = ?", (note_id,)).fetchone()
+        return row[0] if row else None
+
+    def _insert(self, conn, note_id, content):
+        if self._current_version(conn, note_id) is not None:
+            return False
+        # AUTOINCREMENT never reuses a sequence number, so neither are versions
+        seq = self._log_change(conn, "create", note_id)
+        conn.execute("INSERT INTO notes (id, content, version) VALUES (?, ?, ?)", (note_id, content, seq))
+        return True
+
+    def _create(self, note_id, content):
+        with self._write_transaction() as conn:
+            created = self._insert(conn, note_id, content)
+            if created:
+                self._bump_version(conn, 1)
+        return created
+
+    def _update(self, note_id, content, expected_version):
+        with self._write_transaction() as conn:
+            failure = _cas_failure(self._current_version(conn, note_id), expected_version)
+            if failure:
+                return failure
+            seq = self._log_change(conn, "update", note_id)
+            conn.execute("UPDATE notes SET content = ?, version = ? WHERE id = ?", (content, seq, note_id))
+            self._bump_version(conn, 0)
+        return "updated", seq
+
+    def _delete(self, note_id, expected_version):
+        with self._write_transaction() as conn:
+            failure = _cas_failure(self._current_version(conn, note_id), expected_version)
+            if failure:
+                return failure
+            self._log_change(conn, "delete", note_id)
+            conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+            self._bump_version(conn, -1)
+        return "deleted", None
+
+    def _get_many(self, note_ids):
+        found = self._select_many(note_ids, "content")
+        return {note_id: found.get(note_id) for note_id in note_ids}
+
+    def _get_many_versioned(self, note_ids):
+        # One statement per chunk, so content and version are read together
+        found = self._select_many(note_ids, "content, version")
+        return {note_id: found.get(note_id) for note_id in note_ids}
+
+    def _select_many(self, note_ids, columns):
+        conn = self._connect()
+        found = {}
+        unique_ids = list(dict.fromkeys(note_ids))
+        # Stay well below SQLite's limit on bound parameters per statement
+        for start in range(0, len(unique_ids), 500):
+            chunk = unique_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in conn.execute(f"SELECT id, {columns} FROM notes WHERE id IN ({placeholders})", chunk):
+                found[row[0]] = row[1] if len(row) == 2 else row[1:]
+        return found
+
+    def _create_many(self, items):
+        results = []
+        # A single transaction (and a single commit) for the whole batch
+        with self._write_transaction() as conn:
+            for note_id, content in items:
+                results.append(self._insert(conn, note_id, content))
+            if any(results):
+                self._bump_version(conn, sum(results))
+        return results
+
+    def _list_page(self, after, limit, prefix):
+        clauses = []
+        params = []
+        if after is not None:
+            clauses.append("id > ?")
+            params.append(after)
+        if prefix:
+            # A range scan on the primary key instead of LIKE, which can't use it
+            clauses.append("id >= ?")
+            params.append(prefix)
+            upper = _prefix_upper_bound(prefix)
+            if upper is not None:
+                clauses.append("id < ?")
+                params.append(upper)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT id FROM notes {where} ORDER BY id LIMIT ?", (*params, limit + 1)
+        ).fetchall()
+        page = [row[0] for row in rows if row[0].startswith(prefix)]
+        return page[:limit], len(page) > limit
+
+    def _count(self):
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+
+    def _changes_since(self, seq, limit):
+        conn = self._connect()
+        changes = conn.execute(
+            "SELECT seq, op, note_id FROM changes WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        ).fetchall()
+        latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        return changes, latest
+
+    def _version(self):
+        meta = dict(self._connect().execute("SELECT key, value FROM meta WHERE key IN ('store_id', 'version')"))
+        return f"{meta['store_id']}-{meta['version']}"
+
+    async def get(self, note_id):
+        """Return the content of a note, or None if it does not exist."""
+        return await self._run(self._readers, self._get, note_id)
+
+    async def create(self, note_id, content):
+        """Insert a new note. Returns False if the ID is already taken."""
+        return await self._run(self._writer, self._create, note_id, content)
+
+    async def update(self, note_id, content, expected_version=None):
+        """Replace a note's content if it is still at `expected_version` (None: any version).
+
+        Returns ("updated", new version), ("conflict", current version) or
+        ("not_found", None).
+        """
+        return await self._run(self._writer, self._update, note_id, content, expected_version)
+
+    async def delete(self, note_id, expected_version=None):
+        """Delete a note if it is still at `expected_version` (None: any version).
+
+        Returns ("deleted", None), ("conflict", current version) or
+        ("not_found", None).
+        """
+        return await self._run(self._writer, self._delete, note_id, expected_version)
+
+    async def get_many(self, note_ids):
+        """Return a dict mapping each requested ID to its content or None."""
+        return await self._run(self._readers, self._get_many, list(note_ids))
+
+    async def get_many_versioned(self, note_ids):
+        """Return a dict mapping each requested ID to its (content, version), or None."""
+        return await self._run(self._readers, self._get_many_versioned, list(note_ids))
+
+    async def create_many(self, items):
+        """Insert (note_id, content) pairs in order, returning one bool per item."""
+        return await self._run(self._writer, self._create_many, list(items))
+
+    async def list_page(self, after=None, limit=100, prefix=""):
+        """Return up to `limit` IDs sorted after `after` and starting with `prefix`.
+
+        The result is a (note_ids, has_more) tuple.
+        """
+        return await self._run(self._readers, self._list_page, after, limit, prefix)
+
+    async def count(self):
+        """Return the number of stored notes."""
+        return await self._run(self._readers, self._count)
+
+    async def version(self):
+        """Return an opaque token that changes every time a note is written."""
+        return await self._run(self._readers, self._version)
+
+    async def changes_since(self, seq, limit=1000):
+        """Return up to `limit` (seq, op, note_id) writes after `seq`, and the latest seq.
+
+        If the log no longer reaches back to `seq`, the changes start at the
+        oldest write it still holds (see missing_changes).
+        """
+        return await self._run(self._readers, self._changes_since, seq, limit)
+
+    async def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+class CachedNoteStore:
+    """Serves reads of hot notes from a read cache (read_cache.py) in front of another store.
+
+    Every other method is passed straight through. Writes made through this
+    wrapper invalidate the cached copy. Missing notes are never cached, so a
+    note created later, even by another process, is found.
+
+    Notes written by other processes sharing the backend (production
+    workers) are invalidated from the backend's change log, read at most
+    every `refresh_interval` seconds before a read. Those writes can be
+    served stale for up to that long; compare-and-set writes still go to
+    the backend, so a stale version can never overwrite a newer write.
+    """
+
+    def __init__(self, backend, cache, refresh_interval=None):
+        self.backend = backend
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        # Bumped on every invalidation, so a read that raced a write doesn't
+        # cache what it read
+        self._generation = 0
+        self._seq = None
+        self._next_refresh = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _invalidate(self, note_id):
+        self._generation += 1
+        self.cache.invalidate(note_id)
+
+    async def _refresh(self):
+        if self.refresh_interval is None or time.monotonic() < self._next_refresh:
+            return
+        # Set before awaiting so concurrent reads don't refresh too
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        if self._seq is None:
+            # Nothing has been cached yet, so follow the log from here on
+            _, self._seq = await self.backend.changes_since(0, limit=0)
+            return
+        while True:
+            changes, latest = await self.backend.changes_since(self._seq, limit=1000)
+            if missing_changes(self._seq, changes, latest):
+                # Too far behind to tell what changed: start over
+                self._generation += 1
+                self.cache.clear()
+                self._seq = latest
+                return
+            if not changes:
+                return
+            for _, _, note_id in changes:
+                self._invalidate(note_id)
+            self._seq = changes[-1][0]
+
+    async def _lookup(self, note_ids):
+        """Return {note_id: (content, version) or None}, from the cache where possible."""
+        await self._refresh()
+        found = {}
+        for note_id in note_ids:
+            entry = self.cache.get(note_id)
+            if entry is not None:
+                found[note_id] = entry
+        missing = [note_id for note_id in note_ids if note_id not in found]
+        if missing:
+            generation = self._generation
+            fetched = await self.backend.get_many_versioned(missing)
+            for note_id, entry in fetched.items():
+                if entry is not None and generation == self._generation:
+                    self.cache.put(note_id, entry, size=sys.getsizeof(entry[0]) + sys.getsizeof(entry))
+                found[note_id] = entry
+        return found
+
+    async def get(self, note_id):
+        """Return the content of a note, or None if it does not exist."""
+        entry = (await self._lookup([note_id]))[note_id]
+        return entry[0] if entry is not None else None
+
+    async def get_many(self, note_ids):
+        """Return a dict mapping each requested ID to its content or None."""
+        found = await self._lookup(note_ids)
+        return {note_id: found[note_id][0] if found[note_id] is not None else None for note_id in note_ids}
+
+    async def get_many_versioned(self, note_ids):
+        """Return a dict mapping each requested ID to its (content, version), or None."""
+        found = await self._lookup(note_ids)
+        return {note_id: found[note_id] for note_id in note_ids}
+
+    async def create(self, note_id, content):
+        """Insert a new note. Returns False if the ID is already taken."""
+        self._invalidate(note_id)
+        return await self.backend.create(note_id, content)
+
+    async def create_many(self, items):
+        """Insert (note_id, content) pairs in order, returning one bool per item."""
+        items = list(items)
+        for note_id, _ in items:
+            self._invalidate(note_id)
+        return await self.backend.create_many(items)
+
+    async def update(self, note_id, content, expected_version=None):
+        """Replace a note's content if it is still at `expected_version` (None: any version)."""
+        self._invalidate(note_id)
+        try:
+            return await self.backend.update(note_id, content, expected_version)
+        finally:
+            self._invalidate(note_id)
+
+    async def delete(self, note_id, expected_version=None):
+        """Delete a note if it is still at `expected_version` (None: any version)."""
+        self._invalidate(note_id)
+        try:
+            return await self.backend.delete(note_id, expected_version)
+        finally:
+            self._invalidate(note_id)
+
+    async def close(self):
+        await self.backend.close()
+
+
+class NoteLocks:
+    """Per-note asyncio locks for work that spans an await.
+
+    A lock exists only while someone holds or waits for it, so memory stays
+    proportional to the writes in flight, and writers to different notes
+    never wait for each other. Take several at once with hold_many(),
+    which locks in sorted order so two batches can't deadlock.
+    """
+
+    def __init__(self):
+        # note ID -> [lock, number of holders and waiters]
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, note_id):
+        entry = self._locks.get(note_id)
+        if entry is None:
+            entry = self._locks[note_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[note_id]
+
+    @asynccontextmanager
+    async def hold_many(self, note_ids):
+        async with AsyncExitStack() as stack:
+            for note_id in sorted(set(note_ids)):
+                await stack.enter_async_context(self.hold(note_id))
+            yield
+
+    def __len__(self):
+        return len(self._locks)
+
+
+def _prefix_upper_bound(prefix):
+    """Return the smallest string greater than every string starting with prefix."""
+    last = ord(prefix[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        # Skip the surrogate range, which can't be encoded as UTF-8
+        last = 0xE000
+    if last > 0x10FFFF:
+        return None
+    return prefix[:-1] + chr(last)
+
+
+def create_store(kind=None, path=None, seed=None):
+    """Build the storage backend selected by NOTES_STORE / NOTES_DB_PATH.
+
+    The "wal" backend reads NOTES_WAL_DIR, NOTES_DURABILITY and
+    NOTES_SNAPSHOT_EVERY. NOTES_COMPACT=1 makes the "memory" and "wal"
+    backends keep note contents compressed (see compact_notes.py).
+    """
+    kind = kind or os.environ.get("NOTES_STORE", "memory")
+    compact = os.environ.get("NOTES_COMPACT", "") not in ("", "0")
+    if kind == "memory":
+        return MemoryNoteStore(CompactNotes(seed) if compact else seed)
+    if kind == "wal":
+        return WALNoteStore(
+            path or os.environ.get("NOTES_WAL_DIR", "notes-wal"),
+            seed=seed,
+            durability=os.environ.get("NOTES_DURABILITY", "batched"),
+            snapshot_every=int(os.environ.get("NOTES_SNAPSHOT_EVERY", "100000")),
+            compact=compact
+        )
+    if kind == "sqlite":
+        return SQLiteNoteStore(path or os.environ.get("NOTES_DB_PATH", "notes.db"), seed=seed)
+    raise ValueError(f"Unknown note store: {kind}")
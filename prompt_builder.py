@@ -0,0 +1,59 @@
+"""Select the notes to send with a question, within a token budget.
+
+Sending every note with every question makes prompts grow with the note
+store until they no longer fit the model's context window. These helpers rank
+notes against the question with the BM25 index from search_index.py and keep
+only the best ones that fit the budget, so prompt size stays flat.
+"""
+from search_index import InvertedIndex
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of model tokens in text (about 4 characters each)."""
+    return len(text) // 4 + 1
+
+
+def format_note(note_id, content):
+    """Format one note the way it appears in the prompt."""
+    return f"{note_id}: {content}"
+
+
+def rank_notes(question, notes):
+    """Return the IDs of the notes sharing words with the question, best match first."""
+    index = InvertedIndex()
+    for note_id, content in notes.items():
+        # Index the ID too, so questions that name a note find it
+        index.add(note_id, f"{note_id} {content}")
+    return [note_id for note_id, _ in index.search(question, limit=len(notes))]
+
+
+def select_notes(question, notes, token_budget):
+    """Pick the most relevant notes whose formatted text fits in token_budget.
+
+    When no note shares a word with the question, notes are taken in their
+    original order instead. A note too long to fit is skipped in favour of
+    smaller ones further down the ranking, except that the best note is
+    truncated to the budget rather than sending no context at all.
+    """
+    ranked = rank_notes(question, notes) or list(notes)
+    selected = {}
+    used = 0
+    for note_id in ranked:
+        cost = estimate_tokens(format_note(note_id, notes[note_id])) + 1
+        if used + cost <= token_budget:
+            selected[note_id] = notes[note_id]
+            used += cost
+        elif not selected:
+            # Keep about 4 characters per remaining token, leaving room for the ID
+            keep = max(0, (token_budget - estimate_tokens(note_id) - 2) * 4)
+            selected[note_id] = notes[note_id][:keep]
+            used = token_budget
+        if used >= token_budget:
+            break
+    return selected
+
+
+def build_notes_context(question, notes, token_budget):
+    """Return the notes text to include in the prompt for a question."""
+    selected = select_notes(question, notes, token_budget)
+    return "\n".join(format_note(note_id, content) for note_id, content in selected.items())
@@ -0,0 +1,260 @@
+"""In-process cache of note contents for reads, bounded by size in bytes.
+
+Reads are heavily skewed towards a few hot notes, so a small cache in front
+of an on-disk store answers most of them at memory speed. Two policies are
+available:
+
+- "lru": evicts the least recently used note. Simple, but one scan over
+  many cold notes flushes the hot ones out.
+- "w-tinylfu": a small LRU window for new arrivals in front of a segmented
+  LRU main area. A note leaving the window only enters the main area if a
+  frequency sketch says it is accessed more often than the notes it would
+  evict, so hot notes survive scans and bursts of one-off reads.
+
+Sizes are measured with sys.getsizeof, so the bound reflects actual memory.
+"""
+import sys
+from collections import OrderedDict
+
+_MASK64 = (1 << 64) - 1
+
+
+class LRUCache:
+    """Byte-bounded least-recently-used cache."""
+
+    policy = "lru"
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, size=None):
+        """Cache value under key, evicting as needed to stay within max_bytes.
+
+        `size` defaults to sys.getsizeof(value); pass it for containers.
+        """
+        self.invalidate(key)
+        size = sys.getsizeof(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def invalidate(self, key):
+        """Drop key from the cache, if present."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self):
+        """Drop everything, keeping the hit and miss counts."""
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return hit/miss counters, the hit rate and the cache size."""
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes
+        }
+
+
+class CountMinSketch:
+    """Approximate access counts in fixed memory.
+
+    Counters saturate at 15 and are all halved after every 10 * width
+    increments, so popularity from long ago fades.
+    """
+
+    def __init__(self, width):
+        self.width = 1 << max(4, min(32, (width - 1).bit_length()))
+        self._rows = [bytearray(self.width) for _ in range(4)]
+        self._additions = 0
+        self._sample_size = 10 * self.width
+
+    def _slots(self, key):
+        # Both 32-bit halves of two multiplicative hashes give the four rows'
+        # slots; this runs on every cache lookup, so it is kept minimal
+        h = hash(key)
+        a = h * 0x9E3779B97F4A7C15 & _MASK64
+        b = h * 0xC2B2AE3D27D4EB4F & _MASK64
+        mask = self.width - 1
+        return a & mask, a >> 32 & mask, b & mask, b >> 32 & mask
+
+    def increment(self, key):
+        row0, row1, row2, row3 = self._rows
+        slot0, slot1, slot2, slot3 = self._slots(key)
+        if row0[slot0] < 15:
+            row0[slot0] += 1
+        if row1[slot1] < 15:
+            row1[slot1] += 1
+        if row2[slot2] < 15:
+            row2[slot2] += 1
+        if row3[slot3] < 15:
+            row3[slot3] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._age()
+
+    def estimate(self, key):
+        row0, row1, row2, row3 = self._rows
+        slot0, slot1, slot2, slot3 = self._slots(key)
+        return min(row0[slot0], row1[slot1], row2[slot2], row3[slot3])
+
+    def _age(self):
+        halve = bytes(value >> 1 for value in range(256))
+        for row in self._rows:
+            row[:] = row.translate(halve)
+        self._additions //= 2
+
+
+class TinyLFUCache(LRUCache):
+    """Byte-bounded W-TinyLFU cache.
+
+    1% of the bytes go to an LRU window that admits every new note. The
+    rest is a segmented LRU: notes enter on probation and move to the
+    protected segment (80% of the main area) when read again. When the
+    window overflows, its oldest note replaces the main area's eviction
+    victims only if the sketch estimates it is read more often than each
+    of them.
+    """
+
+    policy = "w-tinylfu"
+
+    def __init__(self, max_bytes, window_fraction=0.01, protected_fraction=0.8, sketch_width=None):
+        super().__init__(max_bytes)
+        self.window_bytes = max(1, int(max_bytes * window_fraction))
+        self.main_bytes = max_bytes - self.window_bytes
+        self.protected_max_bytes = int(self.main_bytes * protected_fraction)
+        # Assume notes of around 512 bytes when sizing the sketch
+        self.sketch = CountMinSketch(sketch_width or max(1024, max_bytes // 512))
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._sizes = {"window": 0, "probation": 0, "protected": 0}
+
+    def _segments(self):
+        return (("window", self._window), ("probation", self._probation), ("protected", self._protected))
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        self.sketch.increment(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+            value = self._window[key][0]
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+            value = self._protected[key][0]
+        elif key in self._probation:
+            # A second read promotes the note to the protected segment
+            value, size = self._probation.pop(key)
+            self._sizes["probation"] -= size
+            self._protected[key] = (value, size)
+            self._sizes["protected"] += size
+            while self._sizes["protected"] > self.protected_max_bytes:
+                demoted_key, (demoted, demoted_size) = self._protected.popitem(last=False)
+                self._sizes["protected"] -= demoted_size
+                self._probation[demoted_key] = (demoted, demoted_size)
+                self._sizes["probation"] += demoted_size
+        else:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value, size=None):
+        """Cache value under key; it starts in the window."""
+        self.invalidate(key)
+        size = sys.getsizeof(value) if size is None else size
+        if size > self.main_bytes:
+            return
+        self._window[key] = (value, size)
+        self._sizes["window"] += size
+        self.bytes += size
+        while self._sizes["window"] > self.window_bytes:
+            candidate_key, (candidate, candidate_size) = self._window.popitem(last=False)
+            self._sizes["window"] -= candidate_size
+            self.bytes -= candidate_size
+            self._admit(candidate_key, candidate, candidate_size)
+
+    def _admit(self, key, value, size):
+        # Find the main-area notes that would have to go, probation first
+        needed = self._sizes["probation"] + self._sizes["protected"] + size - self.main_bytes
+        victims = []
+        if needed > 0:
+            frequency = self.sketch.estimate(key)
+            for segment_name, segment in (("probation", self._probation), ("protected", self._protected)):
+                for victim_key, (_, victim_size) in segment.items():
+                    if needed <= 0:
+                        break
+                    if self.sketch.estimate(victim_key) >= frequency:
+                        # The newcomer isn't popular enough to displace them
+                        return
+                    victims.append((segment_name, victim_key))
+                    needed -= victim_size
+        for segment_name, victim_key in victims:
+            _, victim_size = getattr(self, f"_{segment_name}").pop(victim_key)
+            self._sizes[segment_name] -= victim_size
+            self.bytes -= victim_size
+        self._probation[key] = (value, size)
+        self._sizes["probation"] += size
+        self.bytes += size
+
+    def invalidate(self, key):
+        """Drop key from the cache, if present."""
+        for name, segment in self._segments():
+            entry = segment.pop(key, None)
+            if entry is not None:
+                self._sizes[name] -= entry[1]
+                self.bytes -= entry[1]
+                return
+
+    def clear(self):
+        """Drop everything, keeping the hit and miss counts and the frequency sketch."""
+        for _, segment in self._segments():
+            segment.clear()
+        self._sizes = dict.fromkeys(self._sizes, 0)
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._window) + len(self._probation) + len(self._protected)
+
+
+READ_CACHE_POLICIES = {
+    "lru": LRUCache,
+    "w-tinylfu": TinyLFUCache
+}
+
+
+def create_read_cache(policy, max_bytes):
+    """Build the read cache for a policy name, or return None for "none"."""
+    if policy == "none":
+        return None
+    if policy not in READ_CACHE_POLICIES:
+        raise ValueError(f"Unknown read cache policy: {policy} (choose from none, {', '.join(READ_CACHE_POLICIES)})")
+    return READ_CACHE_POLICIES[policy](max_bytes)
@@ -0,0 +1,268 @@
+"""Offline replay of a recorded request stream through the Bedrock clients.
+
+Starts notes_server.py locally and sends every request in a JSONL file
+through the agent loop of bedrock_tool_calling.py (or, with --client
+integration, through bedrock_integration.py). The Bedrock runtime is
+replaced by fake_bedrock.py. Each model call waits a recorded or synthetic
+latency before it answers, so no AWS access is needed and runs can be
+repeated.
+
+Each line of the file is one request, a JSON object holding the question
+as "prompt" (or "title" and "body", like the repo's requests.jsonl). It may
+also hold:
+- "at": when to send it, in seconds from the start of the replay
+- "model_latencies": the latency of each model call it makes, in seconds
+Without "at" the requests are sent back to back, or --rate per second.
+Model calls without a recorded latency take --model-latency seconds,
+varied by up to --latency-jitter. The variation is drawn from a generator
+seeded per request, so it is the same on every run whatever the
+interleaving.
+
+The report gives end-to-end request latency and, per stage (MCP connects,
+tool calls, resource reads, model calls, prompt assembly), the number of
+calls and their latency percentiles.
+
+Example:
+    python replay_requests.py requests.jsonl --rate 5 --concurrency 8 \\
+        --model-latency 0.3 --output replay.json
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import importlib
+import json
+import os
+import random
+import sys
+import time
+
+from bedrock_async import AsyncBedrockRuntime
+from benchmark_server import ServerProcess, percentile
+from fake_bedrock import FakeBedrockRuntime
+from stage_timing import collect_timings
+
+CLIENTS = {
+    "tool_calling": ("bedrock_tool_calling", lambda module, prompt: module.run_agent(prompt)),
+    "integration": ("bedrock_integration", lambda module, prompt: module.answer_question(prompt))
+}
+
+# The latencies still to be replayed for the request being handled
+_model_latencies = contextvars.ContextVar("model_latencies")
+
+
+def load_requests(path, limit=None):
+    """Read the requests to replay as dicts with "prompt", "at" and "model_latencies"."""
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompt = item.get("prompt") or "\n\n".join(filter(None, [item.get("title"), item.get("body")]))
+            if not prompt:
+                raise ValueError(f"Line {line_number}: no prompt, or title and body")
+            requests.append({
+                "id": item.get("request_id", str(line_number)),
+                "prompt": prompt,
+                "at": item.get("at"),
+                "model_latencies": list(item.get("model_latencies", []))
+            })
+            if limit is not None and len(requests) >= limit:
+                break
+    return requests
+
+
+def schedule(requests, rate):
+    """Return each request's send time in seconds from the start, or None to send it right away."""
+    if rate:
+        return [index / rate for index in range(len(requests))]
+    return [request["at"] for request in requests]
+
+
+def request_latencies(request, model_latency, jitter, seed):
+    """Yield the latency of each model call a request makes: recorded ones first, then synthetic."""
+    yield from request["model_latencies"]
+    rng = random.Random(f"{seed}:{request['id']}")
+    while True:
+        yield model_latency * rng.uniform(1 - jitter, 1 + jitter)
+
+
+class ReplayBedrockRuntime(AsyncBedrockRuntime):
+    """AsyncBedrockRuntime over the fake client that waits out the replayed latency of each call.
+
+    Like a real model call, the wait holds one of the runtime's worker threads.
+    """
+
+    def __init__(self, token_latency=0.0, max_workers=50):
+        super().__init__(FakeBedrockRuntime(token_latency=token_latency), max_workers=max_workers)
+
+    async def _wait(self):
+        latencies = _model_latencies.get(None)
+        if latencies is not None:
+            await self._run(time.sleep, next(latencies))
+
+    async def converse(self, **kwargs):
+        await self._wait()
+        return await super().converse(**kwargs)
+
+    async def invoke_model(self, **kwargs):
+        await self._wait()
+        return await super().invoke_model(**kwargs)
+
+    async def converse_stream(self, **kwargs):
+        await self._wait()
+        async for event in super().converse_stream(**kwargs):
+            yield event
+
+    async def invoke_model_with_response_stream(self, **kwargs):
+        await self._wait()
+        async for event in super().invoke_model_with_response_stream(**kwargs):
+            yield event
+
+
+def summarize_stage(durations):
+    """Latency figures (ms) for a list of durations in seconds."""
+    values = sorted(durations)
+    return {
+        "calls": len(values),
+        "total_s": round(sum(values), 3),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3)
+    }
+
+
+async def replay(args, requests, module, ask):
+    """Send the requests on schedule and return the report's results section."""
+    send_times = schedule(requests, args.rate)
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    lags = []
+    errors = []
+    stages = {}
+    started = time.perf_counter()
+
+    async def run_one(request, send_at):
+        if send_at is not None:
+            await asyncio.sleep(max(0.0, started + send_at - time.perf_counter()))
+        due = time.perf_counter()
+        async with slots:
+            # How long the request waited for one of the --concurrency slots
+            began = time.perf_counter()
+            lags.append(began - due)
+            _model_latencies.set(request_latencies(request, args.model_latency, args.latency_jitter, args.seed))
+            with collect_timings() as timings:
+                try:
+                    await ask(module, request["prompt"])
+                except Exception as e:
+                    errors.append({"id": request["id"], "error": repr(e)})
+                    return
+                finally:
+                    for stage, durations in timings.items():
+                        stages.setdefault(stage, []).extend(durations)
+            latencies.append(time.perf_counter() - began)
+            if len(latencies) % 10 == 0:
+                print(f"Replayed {len(latencies)}/{len(requests)} requests", file=sys.stderr, flush=True)
+
+    # Each request runs in its own task, so its context holds its own latencies
+    await asyncio.gather(*(run_one(request, send_at) for request, send_at in zip(requests, send_times)))
+    elapsed = time.perf_counter() - started
+    values = sorted(latencies)
+    return {
+        "requests": len(requests),
+        "completed": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "request": summarize_stage(values) if values else None,
+        "queue_wait": summarize_stage(lags) if lags else None,
+        "stages": {stage: summarize_stage(durations) for stage, durations in sorted(stages.items())},
+        "response_cache": module.response_cache.stats()
+    }
+
+
+def print_table(report):
+    results = report["results"]
+    print(f"{results['completed']}/{results['requests']} requests in {results['elapsed_s']}s "
+          f"({results['throughput_rps']}/s), {len(results['errors'])} errors")
+    print(f"{'stage':>16} {'calls':>7} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = [("request", results["request"]), ("queue_wait", results["queue_wait"]), *results["stages"].items()]
+    for stage, stats in rows:
+        if stats is None:
+            continue
+        print(
+            f"{stage:>16} {stats['calls']:>7} {stats['total_s']:>9} {stats['p50_ms']:>9} "
+            f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay a JSONL request stream against a local server and a stubbed Bedrock.")
+    parser.add_argument("file", nargs="?", default="requests.jsonl", help="JSONL file of requests to replay")
+    parser.add_argument("--client", choices=list(CLIENTS), default="tool_calling", help="Client code path to drive")
+    parser.add_argument("--rate", type=float, help="Requests sent per second (default: each request's \"at\", else back to back)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests handled at once")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Seconds per model call without a recorded latency")
+    parser.add_argument("--latency-jitter", type=float, default=0.2, help="Synthetic latencies vary by up to this fraction")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic latencies")
+    parser.add_argument("--no-response-cache", action="store_true", help="Don't reuse model responses between requests")
+    parser.add_argument("--store", choices=["memory", "wal", "sqlite"], default="memory", help="Server storage backend")
+    parser.add_argument("--port", type=int, default=8767, help="Port for the local server")
+    parser.add_argument("--url", help="Replay against the MCP server at this URL instead of starting one")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    args = parser.parse_args()
+
+    requests = load_requests(args.file, args.limit)
+    module_name, ask = CLIENTS[args.client]
+    # The clients open their caches when imported; keep them in memory so every run starts cold
+    for name in ("BEDROCK_CACHE_PATH", "NOTE_CACHE_PATH"):
+        os.environ.pop(name, None)
+    module = importlib.import_module(module_name)
+    module.mcp_pool.url = args.url or f"http://127.0.0.1:{args.port}/sse"
+    module.bedrock_runtime = ReplayBedrockRuntime(token_latency=args.token_latency)
+    if args.no_response_cache:
+        module.response_cache.max_entries = 0
+
+    report = {
+        "config": {
+            "file": args.file,
+            "client": args.client,
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "model_latency_s": args.model_latency,
+            "latency_jitter": args.latency_jitter,
+            "token_latency_s": args.token_latency,
+            "seed": args.seed,
+            "response_cache": not args.no_response_cache,
+            "store": None if args.url else args.store
+        }
+    }
+    async with contextlib.AsyncExitStack() as stack:
+        if not args.url:
+            await stack.enter_async_context(ServerProcess(args.port, args.store))
+        # The clients print as they go; keep stdout for the report
+        devnull = stack.enter_context(open(os.devnull, "w"))
+        try:
+            with contextlib.redirect_stdout(devnull):
+                report["results"] = await replay(args, requests, module, ask)
+        finally:
+            await module.mcp_pool.close()
+            module.response_cache.close()
+            module.bedrock_runtime.close()
+            if hasattr(module, "note_cache"):
+                module.note_cache.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print_table(report)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""Cache for Bedrock responses keyed by model, prompt and notes version.
+
+Asking the same question about an unchanged set of notes should not pay for
+another model call. Entries live in an in-memory LRU, optionally backed by a
+SQLite file so answers survive restarts, and expire after a TTL. Including
+the notes version in every key means that writing a note makes earlier
+answers unreachable instead of serving them stale.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace and case so trivially different prompts share an entry."""
+    return " ".join(prompt.split()).lower()
+
+
+def make_cache_key(model_id, prompt, notes_version, **extra):
+    """Hash everything that determines a response into a cache key.
+
+    `prompt` may be a string or any JSON-serializable request structure;
+    `extra` holds other request settings that affect the answer.
+    """
+    if isinstance(prompt, str):
+        prompt = normalize_prompt(prompt)
+    raw = json.dumps([model_id, prompt, notes_version, extra], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """LRU cache of JSON-serializable responses with a TTL and optional disk tier."""
+
+    def __init__(self, max_entries=256, ttl=3600.0, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT NOT NULL)"
+                )
+                self._db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT expires, value FROM responses WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+            if row is not None:
+                expires, raw = row
+                value = json.loads(raw)
+                self._remember(key, expires, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        """Store a response under key in memory and, if configured, on disk."""
+        expires = time.time() + self.ttl
+        self._remember(key, expires, value)
+        if self._db is not None:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, expires, value) VALUES (?, ?, ?)",
+                    (key, expires, json.dumps(value))
+                )
+
+    def _remember(self, key, expires, value):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries)
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,91 @@
+"""In-process full-text index with BM25 ranking for note contents."""
+import heapq
+import math
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class InvertedIndex:
+    """Maps each term to the notes containing it and ranks matches with BM25.
+
+    Documents are added and removed incrementally, so the index can be kept
+    up to date as notes are written instead of being rebuilt.
+    """
+
+    # Terms found in more than this share of notes are treated as common
+    COMMON_TERM_FRACTION = 0.05
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {note_id: term frequency}
+        self.postings = {}
+        # note_id -> (document length, distinct terms)
+        self.documents = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, note_id):
+        return note_id in self.documents
+
+    def add(self, note_id, text):
+        """Index a note, replacing any previously indexed version of it."""
+        if note_id in self.documents:
+            self.remove(note_id)
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[note_id] = frequency
+        length = sum(counts.values())
+        self.documents[note_id] = (length, tuple(counts))
+        self.total_length += length
+
+    def remove(self, note_id):
+        """Drop a note from the index if it is present."""
+        entry = self.documents.pop(note_id, None)
+        if entry is None:
+            return
+        length, terms = entry
+        for term in terms:
+            posting = self.postings[term]
+            del posting[note_id]
+            if not posting:
+                del self.postings[term]
+        self.total_length -= length
+
+    def search(self, query, limit=10):
+        """Return up to `limit` (note_id, score) pairs, best match first.
+
+        Terms are scored rarest first. Once rarer terms have produced
+        candidates, terms that appear in a large share of all notes only
+        rescore those candidates, so a common word in the query doesn't
+        force a scan of most of the corpus.
+        """
+        if not self.documents:
+            return []
+        count = len(self.documents)
+        average_length = self.total_length / count or 1
+        postings = [self.postings[term] for term in set(tokenize(query)) if term in self.postings]
+        postings.sort(key=len)
+        scores = {}
+        for posting in postings:
+            frequency = len(posting)
+            idf = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            if scores and frequency > count * self.COMMON_TERM_FRACTION:
+                matches = [(note_id, posting[note_id]) for note_id in scores if note_id in posting]
+            else:
+                matches = posting.items()
+            for note_id, term_frequency in matches:
+                length = self.documents[note_id][0]
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                score = idf * term_frequency * (self.k1 + 1) / (term_frequency + norm)
+                scores[note_id] = scores.get(note_id, 0.0) + score
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
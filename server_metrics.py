@@ -0,0 +1,333 @@
+"""Prometheus-style metrics and a sampling profiler for the Notes MCP server.
+
+The metric types here cover what the server needs without pulling in a
+client library: labelled counters, gauges (fixed or computed at scrape
+time) and histograms, rendered in the Prometheus text exposition format.
+"""
+import asyncio
+import collections
+import functools
+import inspect
+import socket
+import sys
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = collections.defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] += amount
+
+    async def samples(self):
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """A value that can go up and down, or be computed when scraped.
+
+    `function` may be a plain or async callable returning the current value,
+    or, for a gauge with labels, a dict mapping label value tuples to values.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] -= amount
+
+    async def samples(self):
+        if self.function is None:
+            return await super().samples()
+        value = self.function()
+        if inspect.isawaitable(value):
+            value = await value
+        if isinstance(value, dict):
+            return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in sorted(value.items())]
+        return [(self.name, "", value)]
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, optionally split by labels."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._counts = {}
+        self._sums = collections.defaultdict(float)
+
+    def observe(self, value, *labels):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[labels] += value
+
+    async def samples(self):
+        samples = []
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, labels, [("le", le)]), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, labels), self._sums[labels]))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Holds the server's metrics and renders them for /metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    async def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in await metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class ServerMetrics:
+    """The metrics exported by notes_server.py."""
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.requests = self.registry.register(Counter(
+            "notes_requests_total", "Tool calls and resource reads handled, by handler and status.", ["handler", "status"]
+        ))
+        self.latency = self.registry.register(Histogram(
+            "notes_request_duration_seconds", "Time spent in tool and resource handlers.", ["handler"]
+        ))
+        self.in_flight = self.registry.register(Gauge(
+            "notes_requests_in_flight", "Tool calls and resource reads currently running."
+        ))
+        self.sessions = self.registry.register(Gauge(
+            "notes_active_sessions", "Open client connections to the MCP endpoint (SSE streams or streamable-HTTP requests)."
+        ))
+        self.in_flight.set(0)
+        self.sessions.set(0)
+
+    def gauge(self, name, documentation, function, labelnames=()):
+        """Register a gauge computed by `function` whenever metrics are scraped."""
+        return self.registry.register(Gauge(name, documentation, labelnames, function=function))
+
+    def instrument(self, handler):
+        """Decorate an async handler to record its calls, errors and latency.
+
+        A handler fails if it raises or returns a string starting with "Error".
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                self.in_flight.inc()
+                started = time.perf_counter()
+                status = "error"
+                try:
+                    result = await fn(*args, **kwargs)
+                    if not (isinstance(result, str) and result.startswith("Error")):
+                        status = "ok"
+                    return result
+                finally:
+                    self.latency.observe(time.perf_counter() - started, handler)
+                    self.requests.inc(handler, status)
+                    self.in_flight.dec()
+            return wrapper
+        return decorator
+
+    def count_sessions(self, asgi_app, path):
+        """Wrap an ASGI app so requests to `path` (the session stream) are counted."""
+        async def wrapped(scope, receive, send):
+            if scope["type"] != "http" or scope["path"] != path:
+                return await asgi_app(scope, receive, send)
+            self.sessions.inc()
+            try:
+                return await asgi_app(scope, receive, send)
+            finally:
+                self.sessions.dec()
+        return wrapped
+
+    def serve_scrapes(self, asgi_app, sock):
+        """Wrap an ASGI app so its process also answers GET /metrics on `sock`.
+
+        The listener starts on the app's first call (uvicorn's lifespan
+        startup), in the event loop the handlers and computed gauges run in.
+        """
+        server = None
+
+        async def wrapped(scope, receive, send):
+            nonlocal server
+            if server is None:
+                server = await asyncio.start_server(self._answer_scrape, sock=sock)
+            return await asgi_app(scope, receive, send)
+        return wrapped
+
+    async def _answer_scrape(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Skip the headers; a scrape has no body
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", (await self.registry.render()).encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def bind_metrics_port(host, ports):
+    """Return a listening socket on the first of `ports` that no other process holds.
+
+    Each server worker takes one port of the range, so every worker's
+    metrics can be scraped on a port of its own.
+    """
+    for port in ports:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Lets a restarted server take back its ports while connections from
+        # earlier scrapes are in TIME_WAIT; a port another worker is still
+        # listening on stays taken
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+            sock.listen(64)
+        except OSError:
+            sock.close()
+            continue
+        sock.setblocking(False)
+        return sock
+    raise OSError(f"No free metrics port in {ports[0]}-{ports[-1]}")
+
+
+# Shortest sampling interval; below it the sampler would just spin
+MIN_PROFILE_INTERVAL = 0.001
+
+
+class SamplingProfiler:
+    """Samples the server's thread stacks at a fixed interval while running.
+
+    Stacks are aggregated in the "collapsed" format used by flame graph
+    tools: one line per distinct stack, frames joined by ";" followed by the
+    number of samples. Sampling happens on a separate thread and costs
+    nothing while the profiler is stopped.
+    """
+
+    def __init__(self):
+        self.interval = 0.01
+        self.samples = 0
+        self.stacks = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.01, reset=True):
+        """Start sampling every `interval` seconds; does nothing if already running.
+
+        Raises ValueError if `interval` is shorter than MIN_PROFILE_INTERVAL.
+        """
+        if not interval >= MIN_PROFILE_INTERVAL:
+            raise ValueError(f"interval must be at least {MIN_PROFILE_INTERVAL} seconds")
+        if self.running:
+            return
+        with self._lock:
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="notes-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, keeping the samples collected so far."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self, limit=None):
+        """Return the sampled stacks in collapsed format, most frequent first."""
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(limit)) + "\n"
+
+    def status(self):
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks)
+        }
@@ -0,0 +1,40 @@
+"""Per-request timing of the stages of a client call.
+
+The clients mark their stages (MCP connects, tool calls, model calls,
+prompt assembly) with `with timed("model_call"):`. Durations are only
+recorded inside a collect_timings() block, which the replay harness opens
+around each request; everywhere else timed() costs one context variable
+lookup. Tasks started inside the block, such as concurrent tool calls,
+record into the same request.
+"""
+import collections
+import contextvars
+import time
+from contextlib import contextmanager
+
+_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def timed(stage):
+    """Time the block as `stage` of the current request, if one is being collected."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage].append(time.perf_counter() - started)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the stages timed in this block into a dict of stage -> list of durations in seconds."""
+    timings = collections.defaultdict(list)
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
@@ -1,9 +1,10 @@
 import asyncio
 import json
 import traceback
-from mcp.client.session import ClientSession
-from mcp.client.sse import sse_client
-import mcp.types as types
+from mcp_pool import DEFAULT_SERVER_URL, MCPSessionPool
+
+# URIs the server reported as changed (resources/updated notifications)
+updated_uris = []
 
 async def message_handler(message):
     """Handle incoming messages from the server."""
@@ -13,26 +14,23 @@ async def message_handler(message):
         return
     
     print(f"Received message from server: {message}")
+    notification = getattr(message, "root", None)
+    if getattr(notification, "method", None) == "notifications/resources/updated":
+        updated_uris.append(str(notification.params.uri))
 
 async def main():
     print("Connecting to Notes MCP server...")
     try:
-        # Connect to the MCP server using the sse_client
-        print("Establishing SSE connection...")
-        async with sse_client("http://localhost:8080/sse") as (read_stream, write_stream):
-            print("SSE connection established")
-            
-            # Create a client session
-            print("Creating client session...")
-            async with ClientSession(
-                read_stream,
-                write_stream,
-                message_handler=message_handler,
-                client_info=types.Implementation(name="TestClient", version="1.0.0")
-            ) as session:
-                # Initialize the session
-                print("Initializing session...")
-                await session.initialize()
+        # Connect to the MCP server through a session pool
+        print("Creating session pool...")
+        async with MCPSessionPool(
+            DEFAULT_SERVER_URL,
+            client_name="TestClient",
+            message_handler=message_handler
+        ) as pool:
+            # Check out a session; the pool connects and initializes it
+            print("Establishing SSE connection and initializing session...")
+            async with pool.session() as session:
                 print("Session initialized")
                 
                 # List tools
@@ -107,6 +105,22 @@ async def main():
                     print(f"Error reading note: {e}")
                     traceback.print_exc()
                 
+                # Subscribe to the notes listing, so creating a note below
+                # is followed by a resources/updated notification
+                print("Subscribing to notes changes...")
+                try:
+                    capabilities = session.get_server_capabilities()
+                    if not (capabilities and capabilities.resources and capabilities.resources.subscribe):
+                        print(f"Server does not advertise resource subscriptions: {capabilities}")
+                        return
+                    await session.subscribe_resource("resource://notes")
+                    print("Subscribed to resource://notes")
+                    
+                except Exception as e:
+                    print(f"Error subscribing to notes: {e}")
+                    traceback.print_exc()
+                    return
+                
                 # Create a new note
                 print("Creating a new note...")
                 try:
@@ -156,6 +170,16 @@ async def main():
                     print(f"Error reading new note: {e}")
                     traceback.print_exc()
                 
+                # The server batches notifications for writes made close together
+                print("Waiting for the notes changed notification...")
+                for _ in range(20):
+                    if "resource://notes" in updated_uris:
+                        print("Server notified us that resource://notes changed")
+                        break
+                    await asyncio.sleep(0.1)
+                else:
+                    print("No notification for resource://notes")
+                
     except Exception as e:
         print(f"Error connecting to MCP server: {e}")
         traceback.print_exc()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Rejected, parse_costs, retry_after
+
+
+def controller(**kwargs):
+    return AdmissionController(lambda: "client", **kwargs)
+
+
+def test_rate_limited_client_is_rejected_with_a_retry_hint():
+    admission = controller(rate=10, burst=2, max_in_flight=0)
+
+    async def main():
+        await admission.acquire("ReadNote", "a")
+        await admission.acquire("ReadNote", "a")
+        with pytest.raises(Rejected) as rejected:
+            await admission.acquire("ReadNote", "a")
+        assert rejected.value.reason == "rate_limited"
+        assert 0 < rejected.value.retry_after <= 0.1
+        # Other clients have buckets of their own
+        await admission.acquire("ReadNote", "b")
+        await asyncio.sleep(rejected.value.retry_after)
+        await admission.acquire("ReadNote", "a")
+    asyncio.run(main())
+
+
+def test_costs_are_charged_against_the_bucket():
+    admission = controller(rate=10, burst=10, max_in_flight=0, costs={"CreateNotes": 8})
+
+    async def main():
+        await admission.acquire("CreateNotes", "a")
+        with pytest.raises(Rejected):
+            await admission.acquire("CreateNotes", "a")
+        await admission.acquire("ReadNote", "a")
+    asyncio.run(main())
+
+
+def test_full_queue_rejects_without_charging_the_client():
+    admission = controller(rate=10, burst=2, max_in_flight=1, max_queue=0)
+
+    async def main():
+        await admission.acquire("ReadNote", "a")
+        with pytest.raises(Rejected) as rejected:
+            await admission.acquire("ReadNote", "b")
+        assert rejected.value.reason == "queue_full"
+        admission.release()
+        # b's token was refunded, so it can still make two calls
+        await admission.acquire("ReadNote", "b")
+        admission.release()
+        await admission.acquire("ReadNote", "b")
+    asyncio.run(main())
+
+
+def test_queued_call_times_out():
+    admission = controller(rate=0, max_in_flight=1, max_queue=1, queue_timeout=0.01)
+
+    async def main():
+        await admission.acquire("ReadNote", "a")
+        with pytest.raises(Rejected) as rejected:
+            await admission.acquire("ReadNote", "b")
+        assert rejected.value.reason == "queue_timeout"
+        assert admission.queued == 0
+        admission.release()
+        assert admission.in_flight == 0
+    asyncio.run(main())
+
+
+def test_release_hands_the_slot_to_the_queued_call():
+    admission = controller(rate=0, max_in_flight=1, max_queue=1)
+
+    async def main():
+        await admission.acquire("ReadNote", "a")
+        waiting = asyncio.create_task(admission.acquire("ReadNote", "b"))
+        await asyncio.sleep(0)
+        assert admission.queued == 1
+        admission.release()
+        await waiting
+        assert (admission.in_flight, admission.queued) == (1, 0)
+    asyncio.run(main())
+
+
+def test_limit_returns_or_raises_the_rejection():
+    admission = controller(rate=10, burst=1, max_in_flight=0)
+
+    async def handler():
+        return "ok"
+
+    tool = admission.limit("ReadNote")(handler)
+    resource = admission.limit("resource://notes", raise_rejections=True)(handler)
+
+    async def main():
+        assert await tool() == "ok"
+        text = await tool()
+        assert text.startswith("Error: Too many requests (rate_limited); retry after ")
+        assert 0 < retry_after(text) <= 0.1
+        with pytest.raises(Rejected) as rejected:
+            await resource()
+        assert retry_after(f"Error reading resource resource://notes: {rejected.value}") is None
+        assert retry_after(f"Error reading resource resource://notes: {rejected.value}", anywhere=True) == rejected.value.retry_after
+    asyncio.run(main())
+    assert admission.rejections == {("ReadNote", "rate_limited"): 1, ("resource://notes", "rate_limited"): 1}
+    assert admission.stats()["rejected"] == 2
+
+
+def test_parse_costs():
+    assert parse_costs("ListNotes=10, CreateNotes=50,") == {"ListNotes": 10.0, "CreateNotes": 50.0}
+    with pytest.raises(ValueError):
+        parse_costs("ListNotes")
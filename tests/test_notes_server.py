@@ -0,0 +1,131 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import create_connected_server_and_client_session
+from pydantic import AnyUrl
+
+import notes_server
+from admission import retry_after
+from notes_server import decode_cursor, encode_cursor
+
+
+def b64(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+INVALID_CURSORS = [
+    "a",
+    "!!!!",
+    b64(b"not json"),
+    b64(b"\xff\xfe"),
+    b64(b"null"),
+    b64(b'["a", ""]'),
+    b64(b'{"after": "a"}'),
+    b64(b'{"after": 1, "prefix": ""}'),
+]
+
+
+def call(check):
+    """Run `check(session)` against the notes server over an in-memory connection."""
+    async def main():
+        async with create_connected_server_and_client_session(notes_server.app._mcp_server) as session:
+            await check(session)
+    asyncio.run(main())
+
+
+async def tool_text(session, name, arguments):
+    result = await session.call_tool(name, arguments)
+    return result.content[0].text
+
+
+async def read_version(session, note_id):
+    result = json.loads(await tool_text(session, "ReadNotes", {"note_ids": [note_id]}))
+    return result["results"][0]["version"]
+
+
+def test_update_and_delete_check_the_version():
+    async def check(session):
+        await tool_text(session, "CreateNote", {"note_id": "cas-test", "content": "first"})
+        stale = await read_version(session, "cas-test")
+        assert (await tool_text(session, "UpdateNote", {"note_id": "cas-test", "content": "second", "expected_version": stale})).startswith("Note cas-test updated")
+        current = await read_version(session, "cas-test")
+
+        text = await tool_text(session, "UpdateNote", {"note_id": "cas-test", "content": "third", "expected_version": stale})
+        assert text.startswith(f"Error: Version conflict: note cas-test is at version {current}, not {stale}.")
+        text = await tool_text(session, "DeleteNote", {"note_id": "cas-test", "expected_version": stale})
+        assert text.startswith(f"Error: Version conflict: note cas-test is at version {current}, not {stale}.")
+        assert await tool_text(session, "ReadNote", {"note_id": "cas-test"}) == "second"
+
+        assert await tool_text(session, "DeleteNote", {"note_id": "cas-test", "expected_version": current}) == "Note cas-test deleted successfully"
+        assert await tool_text(session, "DeleteNote", {"note_id": "cas-test", "expected_version": current}) == "Error: Note not found"
+        assert await tool_text(session, "UpdateNote", {"note_id": "cas-test", "content": "x", "expected_version": current}) == "Error: Note not found"
+    call(check)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("note/ä?&", "note/")
+    assert all(c.isalnum() or c in "-_" for c in cursor)
+    assert decode_cursor(cursor) == ("note/ä?&", "note/")
+
+
+@pytest.mark.parametrize("cursor", INVALID_CURSORS)
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_list_notes_pages_with_cursors_and_rejects_invalid_ones():
+    async def check(session):
+        for i in range(3):
+            await tool_text(session, "CreateNote", {"note_id": f"cursor-test/{i}", "content": str(i)})
+        page = json.loads(await tool_text(session, "ListNotes", {"prefix": "cursor-test/", "limit": 2}))
+        assert page["note_ids"] == ["cursor-test/0", "cursor-test/1"]
+        # The cursor carries the prefix, so the next page stays filtered
+        page = json.loads(await tool_text(session, "ListNotes", {"cursor": page["next_cursor"], "limit": 2}))
+        assert page == {"note_ids": ["cursor-test/2"], "next_cursor": None}
+
+        for cursor in INVALID_CURSORS:
+            assert await tool_text(session, "ListNotes", {"cursor": cursor}) == "Error: Invalid cursor"
+    call(check)
+
+
+def test_notes_page_resource_rejects_invalid_cursors():
+    async def check(session):
+        result = await session.read_resource(AnyUrl(f"resource://notes/{encode_cursor('note1', 'note')}"))
+        assert json.loads(result.contents[0].text)["note_ids"][:2] == ["note2", "note3"]
+        with pytest.raises(McpError):
+            await session.read_resource(AnyUrl(f"resource://notes/{b64(b'not json')}"))
+    call(check)
+
+
+@pytest.fixture
+def rate_limited(monkeypatch):
+    """Let each client make a single call, with nothing tracked from other tests."""
+    monkeypatch.setattr(notes_server.admission, "rate", 0.01)
+    monkeypatch.setattr(notes_server.admission, "burst", 1.0)
+    monkeypatch.setattr(notes_server.admission, "_buckets", {})
+    monkeypatch.setattr(notes_server.admission, "rejections", notes_server.admission.rejections.copy())
+    return notes_server.admission
+
+
+def test_rejected_calls_are_not_handler_errors(rate_limited):
+    requests = notes_server.metrics.requests._values
+    errors = requests[("ListNotes", "error")], requests[("resource://notes", "error")]
+
+    async def check(session):
+        assert not (await tool_text(session, "ListNotes", {})).startswith("Error")
+        text = await tool_text(session, "ListNotes", {})
+        assert text.startswith("Error: Too many requests (rate_limited); retry after ")
+        assert retry_after(text) > 0
+        # Resource reads can't return an error, so the read itself fails
+        with pytest.raises(McpError) as rejected:
+            await session.read_resource(AnyUrl("resource://notes"))
+        assert retry_after(rejected.value.error.message, anywhere=True) > 0
+    call(check)
+
+    assert rate_limited.rejections[("ListNotes", "rate_limited")] == 1
+    assert rate_limited.rejections[("resource://notes", "rate_limited")] == 1
+    assert (requests[("ListNotes", "error")], requests[("resource://notes", "error")]) == errors
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from notes_store import CachedNoteStore, MemoryNoteStore, SQLiteNoteStore, WALNoteStore
+from read_cache import create_read_cache
+
+STORES = ["memory", "wal", "sqlite", "cached-sqlite"]
+
+
+def open_store(kind, tmp_path):
+    seed = {"a": "first"}
+    if kind == "memory":
+        return MemoryNoteStore(dict(seed))
+    if kind == "wal":
+        return WALNoteStore(str(tmp_path / "wal"), seed=seed)
+    backend = SQLiteNoteStore(str(tmp_path / "notes.db"), seed=seed)
+    if kind == "sqlite":
+        return backend
+    return CachedNoteStore(backend, create_read_cache("lru", 1 << 20), refresh_interval=0)
+
+
+def run(kind, tmp_path, check):
+    async def main():
+        store = open_store(kind, tmp_path)
+        try:
+            await check(store)
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+async def version_of(store, note_id):
+    entry = (await store.get_many_versioned([note_id]))[note_id]
+    return entry[1] if entry is not None else None
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_update_with_current_version(kind, tmp_path):
+    async def check(store):
+        version = await version_of(store, "a")
+        status, new_version = await store.update("a", "second", version)
+        assert status == "updated"
+        assert new_version > version
+        assert await version_of(store, "a") == new_version
+        assert await store.get("a") == "second"
+    run(kind, tmp_path, check)
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_update_with_stale_version_conflicts(kind, tmp_path):
+    async def check(store):
+        stale = await version_of(store, "a")
+        _, current = await store.update("a", "second", stale)
+        assert await store.update("a", "third", stale) == ("conflict", current)
+        assert await store.get("a") == "second"
+        assert await version_of(store, "a") == current
+    run(kind, tmp_path, check)
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_delete_with_stale_version_conflicts(kind, tmp_path):
+    async def check(store):
+        stale = await version_of(store, "a")
+        _, current = await store.update("a", "second", stale)
+        assert await store.delete("a", stale) == ("conflict", current)
+        assert await store.get("a") == "second"
+        assert await store.delete("a", current) == ("deleted", None)
+        assert await store.get("a") is None
+    run(kind, tmp_path, check)
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_missing_note_is_not_found(kind, tmp_path):
+    async def check(store):
+        assert await store.update("missing", "x", 0) == ("not_found", None)
+        assert await store.delete("missing", 0) == ("not_found", None)
+        assert await store.update("missing", "x") == ("not_found", None)
+    run(kind, tmp_path, check)
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_recreated_note_does_not_match_old_version(kind, tmp_path):
+    async def check(store):
+        old = await version_of(store, "a")
+        _, current = await store.update("a", "second", old)
+        await store.delete("a", current)
+        assert await store.create("a", "again")
+        status, version = await store.update("a", "third", current)
+        assert status == "conflict"
+        assert version != current
+    run(kind, tmp_path, check)
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_concurrent_updates_from_one_version(kind, tmp_path):
+    async def check(store):
+        version = await version_of(store, "a")
+        results = await asyncio.gather(*(store.update("a", f"writer {i}", version) for i in range(5)))
+        statuses = sorted(status for status, _ in results)
+        assert statuses == ["conflict"] * 4 + ["updated"]
+    run(kind, tmp_path, check)
+
+
+def test_wal_versions_survive_restart(tmp_path):
+    async def main():
+        store = WALNoteStore(str(tmp_path / "wal"), seed={"a": "first"})
+        _, version = await store.update("a", "second", 0)
+        await store.close()
+        store = WALNoteStore(str(tmp_path / "wal"))
+        try:
+            assert await version_of(store, "a") == version
+            assert await store.update("a", "third", 0) == ("conflict", version)
+        finally:
+            await store.close()
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+import asyncio
+import os
+
+import pytest
+
+from write_ahead_log import WriteAheadLog, _encode_record, _numbered_files
+
+
+def write_segment(directory, start_seq, records):
+    """Write a log segment holding `records`, given as (op, note_id, content), numbered from `start_seq`."""
+    path = os.path.join(directory, f"log-{start_seq:020d}.wal")
+    with open(path, "wb") as f:
+        for seq, (op, note_id, content) in enumerate(records, start_seq):
+            f.write(_encode_record(seq, op, note_id, content))
+    return path
+
+
+def tear(path, size=5):
+    """Cut the last `size` bytes off a file, as a crash in the middle of a write would."""
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - size)
+
+
+def segments(directory):
+    return [os.path.basename(path) for _, path in _numbered_files(directory, "log-", ".wal")]
+
+
+def recover(directory):
+    log = WriteAheadLog(directory)
+    return log, log.recover()
+
+
+def close(log):
+    asyncio.run(log.close())
+
+
+def test_recovers_notes_and_versions(tmp_path):
+    write_segment(tmp_path, 1, [("create", "a", "1"), ("create", "b", "2"), ("update", "a", "3"), ("delete", "b", None)])
+    log, (notes, versions) = recover(tmp_path)
+    assert notes == {"a": "3"}
+    assert versions == {"a": 3}
+    assert log.last_seq == 4
+    close(log)
+
+
+def test_seed_becomes_first_snapshot(tmp_path):
+    log = WriteAheadLog(tmp_path)
+    assert log.recover({"a": "1"}) == ({"a": "1"}, {})
+    close(log)
+    log, state = recover(tmp_path)
+    assert state == ({"a": "1"}, {})
+    close(log)
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = write_segment(tmp_path, 1, [("create", "a", "1"), ("create", "b", "2"), ("create", "c", "3")])
+    tear(path)
+    log, (notes, versions) = recover(tmp_path)
+    assert notes == {"a": "1", "b": "2"}
+    assert log.last_seq == 2
+    assert os.path.getsize(path) == len(_encode_record(1, "create", "a", "1")) + len(_encode_record(2, "create", "b", "2"))
+
+    # New records follow the intact ones and survive the next recovery
+    log.append("create", "d", "4")
+    close(log)
+    log, (notes, versions) = recover(tmp_path)
+    assert notes == {"a": "1", "b": "2", "d": "4"}
+    assert versions["d"] == 3
+    close(log)
+
+
+def test_torn_middle_segment_with_later_records_is_refused(tmp_path):
+    first = write_segment(tmp_path, 1, [("create", "a", "1"), ("create", "b", "2")])
+    write_segment(tmp_path, 3, [("create", "c", "3")])
+    tear(first)
+    size = os.path.getsize(first)
+    with pytest.raises(RuntimeError, match="torn after record 1"):
+        recover(tmp_path)
+    # Nothing is truncated or deleted, so the log can still be inspected
+    assert os.path.getsize(first) == size
+    assert segments(tmp_path) == [f"log-{1:020d}.wal", f"log-{3:020d}.wal"]
+
+
+def test_torn_middle_segment_followed_by_empty_segments(tmp_path):
+    first = write_segment(tmp_path, 1, [("create", "a", "1"), ("create", "b", "2")])
+    write_segment(tmp_path, 3, [])
+    later = write_segment(tmp_path, 4, [("create", "c", "3")])
+    tear(later, os.path.getsize(later) - 3)
+    tear(first)
+    log, (notes, _) = recover(tmp_path)
+    assert notes == {"a": "1"}
+    # The later segments are gone, so they can't be replayed after new records
+    assert segments(tmp_path) == [f"log-{1:020d}.wal", f"log-{2:020d}.wal"]
+
+    log.append("create", "d", "4")
+    close(log)
+    log, (notes, versions) = recover(tmp_path)
+    assert notes == {"a": "1", "d": "4"}
+    assert versions == {"a": 1, "d": 2}
+    close(log)
+
+
+def test_missing_records_are_refused(tmp_path):
+    write_segment(tmp_path, 1, [("create", "a", "1")])
+    write_segment(tmp_path, 3, [("create", "c", "3")])
+    with pytest.raises(RuntimeError, match="missing records before 3"):
+        recover(tmp_path)
+
+
+def test_snapshot_replaces_segments(tmp_path):
+    async def run():
+        log = WriteAheadLog(tmp_path)
+        notes, versions = log.recover()
+        for i in range(3):
+            notes[f"n{i}"] = str(i)
+            versions[f"n{i}"] = log.append("create", f"n{i}", str(i))
+        await log.snapshot(lambda: (dict(notes), dict(versions)))
+        notes["n3"] = "3"
+        versions["n3"] = log.append("create", "n3", "3")
+        await log.close()
+
+    asyncio.run(run())
+    assert segments(tmp_path) == [f"log-{4:020d}.wal"]
+    log, (notes, versions) = recover(tmp_path)
+    assert notes == {"n0": "0", "n1": "1", "n2": "2", "n3": "3"}
+    assert versions == {"n0": 1, "n1": 2, "n2": 3, "n3": 4}
+    close(log)
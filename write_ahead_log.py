@@ -0,0 +1,366 @@
+"""Write-ahead log with group commit for the in-memory note store.
+
+Every write is appended to the log before it is acknowledged, so notes
+survive a crash and are replayed on the next start. The cost of making a
+write durable is the fsync, so the log supports three durability levels:
+
+- "none": records are handed to the OS but never fsynced. They survive a
+  crash of the server process, but not of the machine.
+- "batched" (the default): group commit. Writes that arrive while an fsync
+  is running wait for the next one, so one fsync acknowledges every write
+  queued behind it and throughput grows with concurrency.
+- "per-write": every write gets its own fsync, one after another.
+
+The log is split into segments. A snapshot of all notes is written every
+`snapshot_every` records (and on close), after which the segments it
+covers are deleted, so replay on startup only has to read the log written
+since the last snapshot.
+
+Files in the log directory:
+
+    snapshot-<seq>.json   every note and its version as of record <seq>
+    log-<seq>.wal         records from <seq> onwards
+
+A note's version is the sequence number of the record that last wrote it.
+"""
+import asyncio
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so no protection against a second process
+    fcntl = None
+
+DURABILITY_LEVELS = ("none", "batched", "per-write")
+
+# Each record is framed as <payload length><CRC-32 of payload><payload>, so a
+# record torn by a crash mid-write is detected and dropped during replay
+_HEADER = struct.Struct("<II")
+
+
+def _encode_record(seq, op, note_id, content):
+    payload = json.dumps([seq, op, note_id, content]).encode()
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_records(path):
+    """Return the intact records in a segment and the offset where they end.
+
+    Reading stops at the first torn or corrupt record.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    records = []
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(json.loads(payload))
+        offset = start + length
+    return records, offset
+
+
+def _fsync_directory(path):
+    """Make file creations, renames and deletions in a directory durable."""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _numbered_files(directory, prefix, suffix):
+    """Return (number, path) pairs for files named <prefix><number><suffix>, sorted."""
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            number = name[len(prefix):-len(suffix)]
+            if number.isdigit():
+                found.append((int(number), os.path.join(directory, name)))
+    return sorted(found)
+
+
+class WriteAheadLog:
+    """Append-only log of note writes with group commit and snapshots.
+
+    Appends happen synchronously on the event loop thread, so the order of
+    records always matches the order in which writes were applied; only
+    fsyncs and snapshot writing run on worker threads.
+    """
+
+    def __init__(self, directory, durability="batched", snapshot_every=100_000):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level: {durability} (choose from {', '.join(DURABILITY_LEVELS)})")
+        self.directory = directory
+        self.durability = durability
+        self.snapshot_every = snapshot_every
+        self.records = 0
+        self.syncs = 0
+        self.snapshots = 0
+        self._seq = 0
+        self._durable_seq = 0
+        self._snapshot_seq = 0
+        self._file = None
+        self._lock_file = None
+        self._waiters = []
+        self._flusher = None
+        self._snapshot_task = None
+        self._sync_lock = asyncio.Lock()
+        self._sync_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notes-wal-sync")
+        self._snapshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notes-wal-snapshot")
+
+    def recover(self, seed=None):
+        """Load the latest snapshot, replay the log after it and open it for appends.
+
+        Returns the recovered notes and their versions as two dicts. Notes
+        whose version isn't recorded (the seed) are at version 0 and left
+        out of the versions dict. A new, empty directory starts from `seed`.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_directory()
+        snapshots = _numbered_files(self.directory, "snapshot-", ".json")
+        segments = _numbered_files(self.directory, "log-", ".wal")
+
+        state = None
+        for seq, path in reversed(snapshots):
+            state = self._read_snapshot(path)
+            if state is not None:
+                self._snapshot_seq = self._seq = seq
+                break
+        if state is None:
+            if snapshots or segments:
+                state = {}, {}
+            else:
+                # A fresh directory: make the seed notes the first snapshot
+                state = dict(seed or {}), {}
+                self._write_snapshot(0, state)
+        notes, versions = state
+
+        for index, (_, path) in enumerate(segments):
+            records, end = _read_records(path)
+            for seq, op, note_id, content in records:
+                if seq <= self._seq:
+                    continue
+                if seq != self._seq + 1:
+                    raise RuntimeError(f"Write-ahead log {path} is missing records before {seq}")
+                if op == "delete":
+                    notes.pop(note_id, None)
+                    versions.pop(note_id, None)
+                else:
+                    notes[note_id] = content
+                    versions[note_id] = seq
+                self._seq = seq
+            if end < os.path.getsize(path):
+                # The segment was torn by a crash. Writes to a later segment
+                # are only acknowledged once this one has been fsynced in full,
+                # so if a later segment holds intact records this one was
+                # corrupted some other way (or durability was "none"). Those
+                # records can't be replayed past the gap, and dropping them
+                # could lose acknowledged writes, so refuse to start instead
+                later = [later_path for _, later_path in segments[index + 1:]]
+                if any(_read_records(later_path)[0] for later_path in later):
+                    raise RuntimeError(
+                        f"Write-ahead log {path} is torn after record {self._seq}, "
+                        "but later segments have records that can't be replayed without the lost ones"
+                    )
+                # Drop the torn tail and the empty segments after it, so new
+                # records don't get appended after garbage or replayed out of order
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+                    os.fsync(f.fileno())
+                for later_path in later:
+                    os.remove(later_path)
+                _fsync_directory(self.directory)
+                break
+
+        self._durable_seq = self._seq
+        self._file = self._open_segment(self._seq + 1)
+        return notes, versions
+
+    def _lock_directory(self):
+        # Two processes appending to the same log would interleave records
+        self._lock_file = open(os.path.join(self.directory, "LOCK"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise RuntimeError(f"Write-ahead log {self.directory} is in use by another process") from None
+
+    def _open_segment(self, start_seq):
+        file = open(os.path.join(self.directory, f"log-{start_seq:020d}.wal"), "ab")
+        _fsync_directory(self.directory)
+        return file
+
+    def _read_snapshot(self, path):
+        """Return the (notes, versions) in a snapshot file, or None if it is incomplete."""
+        notes = {}
+        versions = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                for line in f:
+                    # Lines are [id, content], with the version appended if it isn't 0
+                    item = json.loads(line)
+                    notes[item[0]] = item[1]
+                    if len(item) > 2:
+                        versions[item[0]] = item[2]
+        except (OSError, ValueError):
+            return None
+        return (notes, versions) if len(notes) == header["count"] else None
+
+    def _write_snapshot(self, seq, state):
+        notes, versions = state
+        path = os.path.join(self.directory, f"snapshot-{seq:020d}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"seq": seq, "count": len(notes)}) + "\n")
+            for note_id, content in notes.items():
+                version = versions.get(note_id)
+                item = [note_id, content] if version is None else [note_id, content, version]
+                f.write(json.dumps(item) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # The rename is atomic, so a crash leaves either the old or the new snapshot
+        os.replace(tmp_path, path)
+        _fsync_directory(self.directory)
+
+    def _remove_before(self, seq):
+        """Delete snapshots older than `seq` and log segments it makes redundant."""
+        for snapshot_seq, path in _numbered_files(self.directory, "snapshot-", ".json"):
+            if snapshot_seq < seq:
+                os.remove(path)
+        for start_seq, path in _numbered_files(self.directory, "log-", ".wal"):
+            if start_seq <= seq:
+                os.remove(path)
+        _fsync_directory(self.directory)
+
+    def append(self, op, note_id, content=None):
+        """Write one record to the log and return its sequence number.
+
+        The record is not durable until `commit()` returns for it.
+        """
+        self._seq += 1
+        self._file.write(_encode_record(self._seq, op, note_id, content))
+        self.records += 1
+        if self.durability == "none":
+            self._file.flush()
+            self._durable_seq = self._seq
+        return self._seq
+
+    @property
+    def last_seq(self):
+        """Sequence number of the most recent record appended."""
+        return self._seq
+
+    def snapshot_due(self):
+        return self._seq - self._snapshot_seq >= self.snapshot_every and not self.snapshotting
+
+    @property
+    def snapshotting(self):
+        return self._snapshot_task is not None and not self._snapshot_task.done()
+
+    async def commit(self, seq):
+        """Wait until the record with sequence number `seq` is durable."""
+        if self.durability == "none":
+            return
+        if self.durability == "per-write":
+            async with self._sync_lock:
+                await self._sync()
+            return
+        if self._durable_seq >= seq:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_waiters())
+        await waiter
+
+    async def _sync(self):
+        # Callers hold _sync_lock, so the segment can't be swapped underneath
+        target = self._seq
+        self._file.flush()
+        await asyncio.get_running_loop().run_in_executor(self._sync_executor, os.fsync, self._file.fileno())
+        self._durable_seq = max(self._durable_seq, target)
+        self.syncs += 1
+
+    async def _flush_waiters(self):
+        # Writes that arrive during an fsync queue up and share the next one
+        while self._waiters:
+            waiters, self._waiters = self._waiters, []
+            try:
+                async with self._sync_lock:
+                    if self._durable_seq < self._seq:
+                        await self._sync()
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def start_snapshot(self, get_state):
+        """Start a snapshot in the background.
+
+        `get_state` returns a copy of every note and of their versions, as
+        two dicts.
+        """
+        if not self.snapshotting:
+            self._snapshot_task = asyncio.create_task(self.snapshot(get_state))
+        return self._snapshot_task
+
+    async def snapshot(self, get_state):
+        """Write a snapshot of `get_state()` and delete the log it replaces."""
+        loop = asyncio.get_running_loop()
+        async with self._sync_lock:
+            # Copying the notes and switching segments happen without
+            # yielding to the event loop, so the snapshot contains exactly
+            # the records in the segments it replaces
+            seq = self._seq
+            state = get_state()
+            old_file, self._file = self._file, self._open_segment(seq + 1)
+            old_file.flush()
+            await loop.run_in_executor(self._sync_executor, os.fsync, old_file.fileno())
+            old_file.close()
+            self._durable_seq = max(self._durable_seq, seq)
+        await loop.run_in_executor(self._snapshot_executor, self._write_snapshot, seq, state)
+        await loop.run_in_executor(self._snapshot_executor, self._remove_before, seq)
+        self._snapshot_seq = seq
+        self.snapshots += 1
+
+    def stats(self):
+        return {
+            "durability": self.durability,
+            "records": self.records,
+            "syncs": self.syncs,
+            "snapshots": self.snapshots,
+            "seq": self._seq,
+            "durable_seq": self._durable_seq
+        }
+
+    async def close(self, get_state=None):
+        """Make every record durable and, if `get_state` is given, snapshot before closing."""
+        if self._file is None:
+            return
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+        if get_state is not None and self._seq > self._snapshot_seq:
+            await self.snapshot(get_state)
+        async with self._sync_lock:
+            await self._sync()
+        self._file.close()
+        self._file = None
+        self._sync_executor.shutdown(wait=True)
+        self._snapshot_executor.shutdown(wait=True)
+        self._lock_file.close()